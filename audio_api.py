@@ -1,40 +1,64 @@
 #!/usr/bin/env python3
 """
 Simple Audio Control API Server (Secured)
-Runs on port 9998 and provides endpoints to control YouTube stream audio
+Runs on port 9998 and provides endpoints to control YouTube stream audio.
+Also serves /metrics (Prometheus text format) for all cameras, see metrics.py.
+
+Each connection gets its own thread and connections are kept alive (HTTP/1.1),
+so a slow or stalled client can't hold up /health - which the Docker
+HEALTHCHECK depends on. Clients that go quiet for AUDIO_API_TIMEOUT seconds,
+mid-request or between requests, are disconnected.
 """
 
 import os
 import signal
 import json
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import metrics
+import control_plane
+from process_tracker import TrackedProcess
+from log_setup import setup_logging
+
+logger = logging.getLogger("audio_api")
 
-CONTROL_FILE = "/config/audio_mode"
-RESTREAMER_PID_FILE = "/config/youtube_restreamer.pid"
+RUN_DIR = os.getenv("VANTAGECAM_RUN_DIR", "/config")
+CONTROL_FILE = os.path.join(RUN_DIR, "audio_mode")
+RESTREAMER_PID_FILE = os.path.join(RUN_DIR, "youtube_restreamer.pid")
 API_KEY = os.getenv("AUDIO_API_KEY")  # Read key from Docker Env
+API_PORT = int(os.getenv("AUDIO_API_PORT", "9998"))
+REQUEST_TIMEOUT = float(os.getenv("AUDIO_API_TIMEOUT", "10"))  # Idle/stalled client is dropped after this
+MAX_BODY = 64 * 1024  # Request bodies are ignored, but must be read off a kept-alive connection
+
+# Mode changes are read-modify-write (toggle) - one at a time now that requests run in parallel
+mode_lock = threading.RLock()
 
 def get_audio_mode():
-    try:
-        with open(CONTROL_FILE, 'r') as f:
-            mode = f.read().strip()
-            return mode if mode in ['muted', 'unmuted', 'music'] else 'muted'
-    except FileNotFoundError:
-        return 'muted'
+    return control_plane.get('audio_mode', CONTROL_FILE)
 
 def set_audio_mode(mode):
-    with open(CONTROL_FILE, 'w') as f:
-        f.write(mode)
-    
-    # Signal the restreamer to restart
+    with mode_lock:
+        # The control plane pushes the change to start.sh, which restarts the encoder itself
+        # (and writes the audio_mode file); without it, fall back to the file plus a signal
+        if control_plane.set_value('audio_mode', mode, CONTROL_FILE):
+            return True
+
+    # Signal the restreamer to restart (through a pidfd, so a stale PID can't hit another process)
     try:
         with open(RESTREAMER_PID_FILE, 'r') as f:
             pid = int(f.read().strip())
-        os.kill(pid, signal.SIGTERM)
+        with TrackedProcess(pid, 'ffmpeg') as process:
+            process.send_signal(signal.SIGTERM)
         return True
     except (FileNotFoundError, ProcessLookupError, ValueError):
         return False
 
 class AudioControlHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive; every response carries a Content-Length
+    timeout = REQUEST_TIMEOUT      # Socket timeout: a stalled client only ties up its own thread
+
     def log_message(self, format, *args):
         pass  # Suppress default logging
     
@@ -51,11 +75,34 @@ class AudioControlHandler(BaseHTTPRequestHandler):
         return False
 
     def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(body)
+
+    def discard_body(self):
+        """Read (and ignore) a request body so the next request on the connection parses cleanly"""
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length > MAX_BODY or length < 0:
+            self.close_connection = True
+            return False
+        if length:
+            self.rfile.read(length)
+        return True
+
+    def send_text(self, text, content_type='text/plain; charset=utf-8'):
+        body = text.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
     
     def do_GET(self):
         # Health check should always work without auth
@@ -63,6 +110,11 @@ class AudioControlHandler(BaseHTTPRequestHandler):
             self.send_json({'status': 'ok'})
             return
 
+        # Read-only like /health, so scrapers don't need the API key
+        if self.path == '/metrics':
+            self.send_text(metrics.render(), 'text/plain; version=0.0.4; charset=utf-8')
+            return
+
         if not self.check_auth():
             self.send_json({'error': 'Unauthorized'}, 401)
             return
@@ -78,6 +130,10 @@ class AudioControlHandler(BaseHTTPRequestHandler):
             self.send_json({'error': 'Not found'}, 404)
     
     def do_POST(self):
+        if not self.discard_body():
+            self.send_json({'error': 'Request body too large'}, 413)
+            return
+
         if not self.check_auth():
             self.send_json({'error': 'Unauthorized'}, 401)
             return
@@ -89,9 +145,10 @@ class AudioControlHandler(BaseHTTPRequestHandler):
             set_audio_mode('unmuted')
             self.send_json({'audio': 'unmuted', 'muted': False, 'music': False})
         elif self.path == '/audio/toggle':
-            current = get_audio_mode()
-            new_mode = 'unmuted' if current == 'muted' else 'muted'
-            set_audio_mode(new_mode)
+            with mode_lock:
+                current = get_audio_mode()
+                new_mode = 'unmuted' if current == 'muted' else 'muted'
+                set_audio_mode(new_mode)
             self.send_json({'audio': new_mode, 'muted': new_mode == 'muted', 'music': False})
         elif self.path == '/audio/music':
             set_audio_mode('music')
@@ -99,15 +156,20 @@ class AudioControlHandler(BaseHTTPRequestHandler):
         else:
             self.send_json({'error': 'Not found'}, 404)
 
+class AudioAPIServer(ThreadingHTTPServer):
+    daemon_threads = True        # Don't wait for kept-alive connections at shutdown
+    request_queue_size = 64      # Accept backlog for connection bursts
+
 if __name__ == '__main__':
     if not os.path.exists(CONTROL_FILE):
         with open(CONTROL_FILE, 'w') as f:
             f.write('muted')
     
-    server = HTTPServer(('0.0.0.0', 9998), AudioControlHandler)
-    print("[Audio API] Server started on port 9998")
+    setup_logging('Audio API')
+    server = AudioAPIServer(('0.0.0.0', API_PORT), AudioControlHandler)
+    logger.info(f"Server started on port {API_PORT}")
     if API_KEY:
-        print("[Audio API] Secured with API Key protection")
+        logger.info("Secured with API Key protection")
     else:
-        print("[Audio API] WARNING: No API Key set. API is open to everyone.")
+        logger.warning("WARNING: No API Key set. API is open to everyone.")
     server.serve_forever()
\ No newline at end of file
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+VantageCam Benchmarks
+
+encode: what an encoder configuration costs on this host before deploying it.
+A lavfi test pattern is published into a private MediaMTX instance as a stand-in
+camera, then the exact FFmpeg command line start.sh would build (via /pipeline.sh)
+is run against it with a null output. For every configuration in the matrix the
+sustained fps, speed, CPU% and RSS of the encoder are reported; a configuration
+that fails or runs slower than --min-speed (default 1.0 = realtime) is a FAIL.
+
+api: /health latency of the audio API while other clients hammer /audio/* and
+some stall mid-request. A private audio_api.py instance (own port and run dir,
+no encoder to signal) is probed idle, then under load. It fails if any /health
+probe or /audio/* request fails, or the loaded p99 exceeds --max-p99.
+
+Usage (inside the container):
+  python3 /benchmark.py encode --size 2560x1440,1920x1080 --preset faster,veryfast
+  python3 /benchmark.py encode --hw true,false --weather on,off --duration 90 --json
+  python3 /benchmark.py api --clients 50 --stalled 10 --duration 20
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import itertools
+import tempfile
+import threading
+import subprocess
+import http.client
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PIPELINE_SH = os.path.join(SCRIPT_DIR, "pipeline.sh")
+MEDIAMTX_BIN = os.getenv("MEDIAMTX_BIN", "/usr/local/bin/mediamtx")
+
+# Private RTSP port so the benchmark can run next to a live container's MediaMTX (8554)
+BENCH_RTSP_PORT = int(os.getenv("BENCH_RTSP_PORT", "8654"))
+BENCH_PATH = "bench"
+BENCH_API_PORT = int(os.getenv("BENCH_API_PORT", "9898"))
+AUDIO_API = os.path.join(SCRIPT_DIR, "audio_api.py")
+HEALTHCHECK_TIMEOUT = 15  # Dockerfile HEALTHCHECK --timeout: a slower /health counts as failed
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def log(message):
+    print(f"[Benchmark] {message}", file=sys.stderr, flush=True)
+
+
+def csv_list(value):
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+# ==============================================================================
+#  SYNTHETIC CAMERA
+# ==============================================================================
+
+def start_mediamtx(work_dir):
+    config_path = os.path.join(work_dir, "mediamtx.yml")
+    with open(config_path, "w") as f:
+        f.write(f"rtspAddress: :{BENCH_RTSP_PORT}\n"
+                "protocols: [tcp]\n"
+                "rtmpDisable: yes\n"
+                "hlsDisable: yes\n"
+                "webrtcDisable: yes\n"
+                "srtDisable: yes\n"
+                "api: no\n"
+                "paths: { all: }\n")
+    return subprocess.Popen([MEDIAMTX_BIN, config_path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def make_source_clip(work_dir, size, fps):
+    """Pre-encode a short test pattern so publishing it is a cheap stream copy."""
+    clip = os.path.join(work_dir, f"source_{size}.mkv")
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                    "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}",
+                    "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+                    "-t", "20", "-c:v", "libx264", "-preset", "veryfast", "-g", str(fps * 2),
+                    "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "128k", clip], check=True)
+    return clip
+
+
+def start_publisher(clip):
+    return subprocess.Popen(["ffmpeg", "-hide_banner", "-loglevel", "error", "-re",
+                             "-stream_loop", "-1", "-i", clip, "-c", "copy",
+                             "-f", "rtsp", "-rtsp_transport", "tcp",
+                             f"rtsp://127.0.0.1:{BENCH_RTSP_PORT}/{BENCH_PATH}"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def make_overlays(work_dir):
+    """Semi-transparent stand-ins for the sponsor and weather overlays (same sizes as start.sh)."""
+    playlists = {}
+    for name, size in (("tl", "500x500"), ("tr", "400x400"), ("weather", "900x500")):
+        png = os.path.join(work_dir, f"overlay_{name}.png")
+        subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                        "-f", "lavfi", "-i", f"color=c=black@0.6:s={size},format=rgba",
+                        "-frames:v", "1", png], check=True)
+        playlist = os.path.join(work_dir, f"overlay_{name}.txt")
+        with open(playlist, "w") as f:
+            f.write(f"file '{png}'\nduration 10\nfile '{png}'\n")
+        playlists[name] = playlist
+    return playlists
+
+
+# ==============================================================================
+#  COMMAND LINE (built by pipeline.sh, exactly as start.sh does)
+# ==============================================================================
+
+def build_command(config, overlays, work_dir):
+    width, height = config["size"].split("x")
+    env = dict(os.environ,
+               RTSP_SOURCE=f"rtsp://127.0.0.1:{BENCH_RTSP_PORT}/{BENCH_PATH}",
+               DIRECT_YOUTUBE_MODE="true",
+               HARDWARE_ACCEL=config["hw"],
+               VAAPI_DEVICE=os.getenv("VAAPI_DEVICE", "/dev/dri/renderD128"),
+               SOFTWARE_PRESET=config["preset"],
+               SOFTWARE_CRF=str(config["crf"]),
+               SCALING_MODE=config["scaling"],
+               YOUTUBE_WIDTH=width,
+               YOUTUBE_HEIGHT=height,
+               YOUTUBE_BITRATE=config["bitrate"],
+               SCALE_ADS_TL="500",
+               SCALE_ADS_TR="400",
+               WEATHER_ENABLED="true" if config["weather"] == "on" else "false",
+               AD_PLAYLIST_TL=overlays["tl"],
+               AD_PLAYLIST_TR=overlays["tr"],
+               WEATHER_LIST=overlays["weather"],
+               SOURCE_PROFILE_FILE=os.path.join(work_dir, "source_profile"),
+               FFMPEG_PROGRESS_ARG="-nostats -progress pipe:1",
+               PIPELINE_SH=PIPELINE_SH)
+    script = ('log() { :; }\n'
+              'source "$PIPELINE_SH"\n'
+              'STREAM_OUTPUT=(-f null -)\n'
+              'build_filter_chain\n'
+              'build_camera_cmd muted\n'
+              'printf "%s\\0" "${FFMPEG_CMD[@]}"\n')
+    out = subprocess.run(["bash", "-c", script], env=env, capture_output=True, check=True).stdout
+    return [arg.decode() for arg in out.split(b"\0") if arg]
+
+
+# ==============================================================================
+#  MEASUREMENT
+# ==============================================================================
+
+def read_progress(stream, blocks):
+    """Collect completed -progress blocks as (wall time, {key: value})."""
+    block = {}
+    for raw in stream:
+        key, _, value = raw.decode(errors="replace").strip().partition("=")
+        block[key] = value
+        if key == "progress":
+            blocks.append((time.monotonic(), block))
+            block = {}
+
+
+def read_proc(pid):
+    """Return (cpu ticks, rss kB) for pid, or None once it has exited."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = int(fields[11]) + int(fields[12])  # utime + stime
+        rss = 0
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1])
+                    break
+        return ticks, rss
+    except (FileNotFoundError, ProcessLookupError, IndexError, ValueError):
+        return None
+
+
+def run_config(cmd, duration, warmup, work_dir):
+    stderr_path = os.path.join(work_dir, "encoder_stderr.log")
+    blocks = []
+    with open(stderr_path, "wb") as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, stdin=subprocess.DEVNULL)
+    reader = threading.Thread(target=read_progress, args=(proc.stdout, blocks), daemon=True)
+    reader.start()
+
+    start = time.monotonic()
+    base = None
+    rss_samples = []
+    try:
+        while time.monotonic() - start < warmup + duration:
+            time.sleep(1)
+            if proc.poll() is not None:
+                break
+            sample = read_proc(proc.pid)
+            if sample is None:
+                break
+            if time.monotonic() - start >= warmup:
+                if base is None:
+                    base = (time.monotonic(), sample[0], len(blocks))
+                rss_samples.append(sample[1])
+        end_sample = read_proc(proc.pid)
+        end_time = time.monotonic()
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    if base is None or end_sample is None or len(blocks) <= base[2]:
+        with open(stderr_path, "rb") as f:
+            tail = f.read().decode(errors="replace").strip().splitlines()[-3:]
+        return {"error": " | ".join(tail) or f"encoder exited with code {proc.returncode}"}
+
+    # Sustained numbers only cover the window after warmup
+    t0, b0 = blocks[base[2] - 1] if base[2] else (start, {})
+    t1, b1 = blocks[-1]
+    wall = max(t1 - t0, 1e-6)
+    frames = int(b1.get("frame", 0)) - int(b0.get("frame", 0))
+    media_us = int(b1.get("out_time_us", 0) or 0) - int(b0.get("out_time_us", 0) or 0)
+    return {
+        "fps": round(frames / wall, 1),
+        "speed": round(media_us / 1e6 / wall, 2),
+        "cpu_percent": round((end_sample[0] - base[1]) / CLK_TCK / max(end_time - base[0], 1e-6) * 100, 1),
+        "rss_mb": round(max(rss_samples) / 1024, 1),
+        "rss_avg_mb": round(sum(rss_samples) / len(rss_samples) / 1024, 1),
+    }
+
+
+# ==============================================================================
+#  API LOAD
+# ==============================================================================
+
+def start_audio_api(work_dir, key):
+    # Own control socket (never created): mode changes stay in work_dir instead of reaching the live stream
+    env = dict(os.environ, VANTAGECAM_RUN_DIR=work_dir, METRICS_DIR=os.path.join(work_dir, "metrics"),
+               VANTAGECAM_CONTROL_SOCKET=os.path.join(work_dir, "control.sock"),
+               AUDIO_API_PORT=str(BENCH_API_PORT), AUDIO_API_KEY=key)
+    proc = subprocess.Popen([sys.executable, AUDIO_API], env=env, cwd=work_dir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and proc.poll() is None:
+        try:
+            socket.create_connection(("127.0.0.1", BENCH_API_PORT), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    proc.wait()
+    return None
+
+
+def hammer(key, stop, counts):
+    """One keep-alive client cycling through the audio endpoints as fast as the server answers"""
+    requests = [("POST", "/audio/toggle"), ("GET", "/audio/status"), ("POST", "/audio/mute"), ("GET", "/audio/status")]
+    conn = None
+    i = 0
+    while not stop.is_set():
+        method, path = requests[i % len(requests)]
+        i += 1
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection("127.0.0.1", BENCH_API_PORT, timeout=HEALTHCHECK_TIMEOUT)
+            conn.request(method, path, headers={"X-API-Key": key})
+            response = conn.getresponse()
+            response.read()
+            counts["ok" if response.status == 200 else "errors"] += 1
+            if response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            counts["errors"] += 1
+            if conn:
+                conn.close()
+            conn = None
+    if conn:
+        conn.close()
+
+
+def stall(stop, counts):
+    """A client that sends half a request and goes quiet; reconnects whenever the server drops it"""
+    sock = None
+    while not stop.is_set():
+        try:
+            if sock is None:
+                sock = socket.create_connection(("127.0.0.1", BENCH_API_PORT), timeout=1)
+                sock.sendall(b"GET /audio/status HTTP/1.1\r\nHost: localhost\r\n")  # No blank line - never ends
+            if sock.recv(1024) == b"":
+                counts["dropped"] += 1
+                sock.close()
+                sock = None
+        except socket.timeout:
+            continue
+        except OSError:
+            if sock:
+                sock.close()
+            sock = None
+            time.sleep(0.1)
+    if sock:
+        sock.close()
+
+
+def probe_health(duration, interval):
+    """/health on a fresh connection each time, like the HEALTHCHECK's curl. Returns latencies (None = failed)."""
+    samples = []
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        started = time.monotonic()
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", BENCH_API_PORT, timeout=HEALTHCHECK_TIMEOUT)
+            conn.request("GET", "/health")
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            samples.append(time.monotonic() - started if response.status == 200 else None)
+        except (OSError, http.client.HTTPException):
+            samples.append(None)
+        time.sleep(max(0, interval - (time.monotonic() - started)))
+    return samples
+
+
+def api_failures(results, max_p99):
+    """Why the api benchmark failed (empty = passed)"""
+    failures = [f"{phase}: {results[phase]['failed']} /health probe(s) failed"
+                for phase in ("idle", "load") if results[phase]["failed"]]
+    p99 = results["load"]["p99_ms"]
+    if p99 is not None and p99 > max_p99:
+        failures.append(f"load: /health p99 {p99} ms > {max_p99:g} ms")
+    if results["load"]["audio_errors"]:
+        failures.append(f"load: {results['load']['audio_errors']} /audio/* request(s) failed")
+    return failures
+
+
+def latency_stats(samples):
+    ok = sorted(s * 1000 for s in samples if s is not None)
+    def pct(p):
+        return round(ok[min(int(len(ok) * p), len(ok) - 1)], 2) if ok else None
+    return {"probes": len(samples), "failed": len(samples) - len(ok), "p50_ms": pct(0.5), "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99), "max_ms": round(ok[-1], 2) if ok else None}
+
+
+# ==============================================================================
+#  COMMANDS
+# ==============================================================================
+
+def cmd_encode(args):
+    matrix = [dict(zip(("size", "preset", "crf", "scaling", "weather", "hw"), combo), bitrate=args.bitrate)
+              for combo in itertools.product(csv_list(args.size), csv_list(args.preset), csv_list(args.crf),
+                                             csv_list(args.scaling), csv_list(args.weather), csv_list(args.hw))]
+    work_dir = tempfile.mkdtemp(prefix="vantagecam-bench-")
+    mediamtx = publisher = None
+    results = []
+    try:
+        log(f"Preparing {args.source}@{args.fps} test source...")
+        clip = make_source_clip(work_dir, args.source, args.fps)
+        overlays = make_overlays(work_dir)
+        mediamtx = start_mediamtx(work_dir)
+        time.sleep(1)
+        publisher = start_publisher(clip)
+        time.sleep(3)
+        if mediamtx.poll() is not None or publisher.poll() is not None:
+            log("ERROR: synthetic camera failed to start (is another MediaMTX using the port?)")
+            return 1
+
+        for i, config in enumerate(matrix, 1):
+            log(f"[{i}/{len(matrix)}] {config['size']} preset={config['preset']} crf={config['crf']} "
+                f"scaling={config['scaling']} weather={config['weather']} hw={config['hw']}")
+            cmd = build_command(config, overlays, work_dir)
+            result = dict(config, **run_config(cmd, args.duration, args.warmup, work_dir))
+            result["passed"] = "error" not in result and result["speed"] >= args.min_speed
+            if args.verbose:
+                result["command"] = cmd
+            results.append(result)
+    finally:
+        for proc in (publisher, mediamtx):
+            if proc and proc.poll() is None:
+                proc.terminate()
+                proc.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    failed = sum(not r["passed"] for r in results)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 1 if failed else 0
+
+    print(f"{'size':<10} {'preset':<10} {'crf':>3} {'scaling':<7} {'wx':<3} {'hw':<5} "
+          f"{'fps':>6} {'speed':>6} {'cpu%':>7} {'rss MB':>7}")
+    for r in results:
+        row = f"{r['size']:<10} {r['preset']:<10} {r['crf']:>3} {r['scaling']:<7} {r['weather']:<3} {r['hw']:<5} "
+        if "error" in r:
+            print(row + f"FAILED: {r['error']}")
+        else:
+            print(row + f"{r['fps']:>6} {r['speed']:>6} {r['cpu_percent']:>7} {r['rss_mb']:>7}"
+                  + ("" if r["passed"] else f"  FAIL: speed < {args.min_speed:g}"))
+    print(f"\nfps/speed are sustained after a {args.warmup}s warmup; the source runs at {args.fps} fps, "
+          f"so speed >= 1.0 means the host keeps up. cpu% is % of one core.")
+    print(f"{len(results) - failed}/{len(results)} configurations passed (--min-speed {args.min_speed:g})")
+    return 1 if failed else 0
+
+
+def cmd_api(args):
+    work_dir = tempfile.mkdtemp(prefix="vantagecam-bench-")
+    key = "benchmark"
+    server = None
+    results = {}
+    try:
+        server = start_audio_api(work_dir, key)
+        if server is None:
+            log(f"ERROR: audio API did not start on port {BENCH_API_PORT}")
+            return 1
+
+        log(f"Idle: probing /health for {args.duration}s...")
+        results["idle"] = latency_stats(probe_health(args.duration, args.interval))
+
+        log(f"Load: {args.clients} clients on /audio/*, {args.stalled} stalled, for {args.duration}s...")
+        stop = threading.Event()
+        counts = {"ok": 0, "errors": 0, "dropped": 0}
+        threads = [threading.Thread(target=stall, args=(stop, counts), daemon=True) for _ in range(args.stalled)]
+        threads += [threading.Thread(target=hammer, args=(key, stop, counts), daemon=True) for _ in range(args.clients)]
+        for t in threads:
+            t.start()
+        time.sleep(0.5)  # Let the stalled clients get their half-requests in first
+        started = time.monotonic()
+        results["load"] = latency_stats(probe_health(args.duration, args.interval))
+        elapsed = time.monotonic() - started
+        stop.set()
+        for t in threads:
+            t.join(timeout=HEALTHCHECK_TIMEOUT)
+        results["load"].update(audio_requests=counts["ok"], audio_errors=counts["errors"],
+                               audio_rps=round(counts["ok"] / elapsed, 1), stalled_dropped=counts["dropped"])
+        results["failures"] = api_failures(results, args.max_p99)
+    finally:
+        if server and server.poll() is None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 1 if results["failures"] else 0
+
+    print(f"{'phase':<6} {'probes':>6} {'failed':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for phase in ("idle", "load"):
+        r = results[phase]
+        print(f"{phase:<6} {r['probes']:>6} {r['failed']:>6} {r['p50_ms']!s:>8} {r['p95_ms']!s:>8} "
+              f"{r['p99_ms']!s:>8} {r['max_ms']!s:>8}")
+    load = results["load"]
+    print(f"\n/audio/* under load: {load['audio_requests']} requests ({load['audio_rps']}/s), "
+          f"{load['audio_errors']} errors; stalled clients dropped by the server: {load['stalled_dropped']}")
+    print(f"A /health probe fails if it takes over {HEALTHCHECK_TIMEOUT}s (the HEALTHCHECK timeout).")
+    for failure in results["failures"]:
+        print(f"FAIL: {failure}")
+    print("FAIL" if results["failures"] else f"PASS (loaded /health p99 <= {args.max_p99:g} ms, no failed requests)")
+    return 1 if results["failures"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VantageCam benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enc = sub.add_parser("encode", help="Encoder throughput for a matrix of configurations")
+    enc.add_argument("--size", default=os.getenv("YOUTUBE_WIDTH", "2560") + "x" + os.getenv("YOUTUBE_HEIGHT", "1440"),
+                     help="Output sizes, comma separated (WxH)")
+    enc.add_argument("--preset", default=os.getenv("SOFTWARE_PRESET", "faster"), help="x264 presets, comma separated")
+    enc.add_argument("--crf", default=os.getenv("SOFTWARE_CRF", "23"), help="x264 CRF values, comma separated")
+    enc.add_argument("--scaling", default=os.getenv("SCALING_MODE", "fill"), help="fill and/or fit")
+    enc.add_argument("--weather", default="on", help="Weather overlay on and/or off")
+    enc.add_argument("--hw", default="false", help="Hardware (VAAPI) encoding: true and/or false")
+    enc.add_argument("--bitrate", default=os.getenv("YOUTUBE_BITRATE", "4500k"), help="Output bitrate")
+    enc.add_argument("--source", default="2560x1440", help="Synthetic camera size (WxH)")
+    enc.add_argument("--fps", type=int, default=30, help="Synthetic camera frame rate")
+    enc.add_argument("--duration", type=int, default=60, help="Measured seconds per configuration")
+    enc.add_argument("--warmup", type=int, default=10, help="Seconds ignored at the start of each run")
+    enc.add_argument("--min-speed", type=float, default=1.0,
+                     help="Slowest sustained speed that passes (default 1.0 = realtime; exit code 1 otherwise)")
+    enc.add_argument("--json", action="store_true", help="Print results as JSON")
+    enc.add_argument("--verbose", action="store_true", help="Include the FFmpeg command line in JSON results")
+    enc.set_defaults(func=cmd_encode)
+
+    api = sub.add_parser("api", help="Audio API /health latency while other clients load /audio/*")
+    api.add_argument("--clients", type=int, default=50, help="Keep-alive clients hammering /audio/*")
+    api.add_argument("--stalled", type=int, default=10, help="Clients that send half a request and go quiet")
+    api.add_argument("--duration", type=int, default=20, help="Seconds per phase (idle, then load)")
+    api.add_argument("--interval", type=float, default=0.1, help="Seconds between /health probes")
+    api.add_argument("--max-p99", type=float, default=250,
+                     help="Highest /health p99 under load that passes, in ms (default 250; exit code 1 otherwise)")
+    api.add_argument("--json", action="store_true", help="Print results as JSON")
+    api.set_defaults(func=cmd_api)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VantageCam control plane
+A local Unix socket for runtime control, replacing flag files that every
+reader polled once a second:
+
+  audio_mode                muted | unmuted | music   (audio_api.py -> start.sh)
+  stream_mode[/<camera>]    normal | fallback         (start.sh -> watchdog, health bus)
+  overlay/<name>            events only: an overlay image was replaced (start.sh)
+
+The protocol is one JSON object per line, in both directions:
+
+  {"op": "get", "key": "audio_mode"}                -> {"ok": true, "key": ..., "value": "muted"}
+  {"op": "set", "key": "audio_mode", "value": "music"} -> {"ok": true, "changed": true}
+  {"op": "publish", "key": "overlay/weather"}       -> {"ok": true}
+  {"op": "subscribe", "keys": ["stream_mode"]}      -> {"ok": true}, then the current values and
+        every later change as {"event": "state"|"publish", "key": ..., "value": ...}
+
+A key matches a subscription to itself or to any of its prefixes ("stream_mode"
+also covers "stream_mode/cam1"). Each set also writes the old flag file
+(atomically), so anything that still reads the files keeps working.
+If the socket is down, the clients here fall back to the files.
+
+Usage:
+  control_plane.py serve
+  control_plane.py get KEY | set KEY VALUE | publish KEY [VALUE]
+  control_plane.py subscribe KEY...    ("KEY VALUE" lines, for start.sh's coproc)
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger("control_plane")
+
+CONTROL_SOCKET = os.getenv("VANTAGECAM_CONTROL_SOCKET", "/dev/shm/vantagecam/control.sock")
+RUN_DIR = os.getenv("VANTAGECAM_RUN_DIR", "/config")
+
+# Allowed values per state key (the part before any "/<camera>")
+STATES = {
+    'audio_mode': ('muted', 'unmuted', 'music'),
+    'stream_mode': ('normal', 'fallback'),
+}
+DEFAULTS = {'audio_mode': 'muted', 'stream_mode': 'normal'}
+EVENT_PREFIXES = ('overlay',)
+
+MAX_LINE = 64 * 1024
+MAX_BACKLOG = 256 * 1024    # A subscriber this far behind is disconnected
+RECONNECT_DELAY = 2
+
+
+def stream_mode_key(camera=None):
+    return f"stream_mode/{camera}" if camera else "stream_mode"
+
+
+def compat_file(key, run_dir=RUN_DIR):
+    """The flag file a state key used to live in"""
+    base, _, camera = key.partition('/')
+    if camera:
+        return os.path.join(run_dir, "cameras", camera, base)
+    return os.path.join(run_dir, base)
+
+
+def read_compat(key, path=None):
+    """A state from its flag file (path defaults to compat_file(key)); the default if missing or invalid"""
+    base = key.partition('/')[0]
+    try:
+        with open(path or compat_file(key)) as f:
+            value = f.read().strip()
+        return value if value in STATES.get(base, ()) else DEFAULTS.get(base)
+    except OSError:
+        return DEFAULTS.get(base)
+
+
+def write_compat(key, value, run_dir=RUN_DIR, path=None):
+    """Atomically replace a state's flag file (path defaults to compat_file(key, run_dir))"""
+    path = path or compat_file(key, run_dir)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(value + "\n")
+    os.replace(tmp, path)
+
+
+def matches(key, patterns):
+    return any(key == p or key.startswith(p + '/') for p in patterns)
+
+
+# ==============================================================================
+#  SERVER
+# ==============================================================================
+
+class ControlPlane:
+    """The state (seeded from the flag files) and the subscriber fan-out"""
+
+    def __init__(self, run_dir=RUN_DIR):
+        self.run_dir = run_dir
+        self.values = {}
+        self.subscribers = {}      # StreamWriter -> key patterns
+        self.load()
+
+    def load(self):
+        cameras = os.path.join(self.run_dir, "cameras")
+        keys = ['audio_mode', 'stream_mode'] + \
+            [stream_mode_key(c) for c in (sorted(os.listdir(cameras)) if os.path.isdir(cameras) else ())]
+        for key in keys:
+            path = compat_file(key, self.run_dir)
+            if os.path.exists(path):
+                self.values[key] = read_compat(key, path)
+
+    def validate(self, key, value):
+        base, _, camera = key.partition('/')
+        if base in STATES:
+            if value not in STATES[base]:
+                return f"{base} must be one of: {', '.join(STATES[base])}"
+            if base == 'audio_mode' and camera:
+                return "audio_mode is not per camera"
+            if camera and ('/' in camera or camera in ('.', '..')):
+                return "bad camera name"
+            return None
+        return f"unknown key {key}"
+
+    def set(self, key, value):
+        """Store and broadcast a state change; returns (changed, error)"""
+        error = self.validate(key, value)
+        if error:
+            return False, error
+        if self.values.get(key) == value:
+            return False, None
+        self.values[key] = value
+        try:
+            write_compat(key, value, self.run_dir)
+        except OSError as e:
+            logger.warning(f"Could not write {compat_file(key, self.run_dir)}: {e}")
+        logger.info(f"{key} -> {value}")
+        self.broadcast({'event': 'state', 'key': key, 'value': value})
+        return True, None
+
+    def broadcast(self, event):
+        line = (json.dumps(event) + "\n").encode()
+        for writer, patterns in list(self.subscribers.items()):
+            if not matches(event['key'], patterns):
+                continue
+            if writer.transport.get_write_buffer_size() > MAX_BACKLOG:
+                logger.warning("Dropping a subscriber that stopped reading")
+                self.subscribers.pop(writer, None)
+                writer.close()
+                continue
+            writer.write(line)
+
+    def handle_request(self, request, writer):
+        op, key = request.get('op'), request.get('key') or ''
+        if op == 'get':
+            if key not in self.values and key.partition('/')[0] not in DEFAULTS:
+                return {'ok': False, 'error': f"unknown key {key}"}
+            return {'ok': True, 'key': key, 'value': self.values.get(key, DEFAULTS.get(key.partition('/')[0]))}
+        if op == 'set':
+            changed, error = self.set(key, request.get('value'))
+            return {'ok': False, 'error': error} if error else {'ok': True, 'changed': changed}
+        if op == 'publish':
+            if not matches(key, EVENT_PREFIXES):
+                return {'ok': False, 'error': f"events must be under: {', '.join(EVENT_PREFIXES)}"}
+            self.broadcast({'event': 'publish', 'key': key, 'value': request.get('value')})
+            return {'ok': True}
+        if op == 'subscribe':
+            patterns = request.get('keys', [key] if key else [])
+            if not isinstance(patterns, list) or not patterns or not all(isinstance(p, str) and p for p in patterns):
+                return {'ok': False, 'error': "subscribe needs keys: a list of strings"}
+            self.subscribers[writer] = self.subscribers.get(writer, []) + patterns
+            writer.write(b'{"ok": true}\n')
+            for k, v in sorted(self.values.items()):
+                if matches(k, patterns):
+                    writer.write((json.dumps({'event': 'state', 'key': k, 'value': v}) + "\n").encode())
+            # Subscribed to a state nobody has set yet: start from its default
+            for p in patterns:
+                if p in DEFAULTS and p not in self.values:
+                    writer.write((json.dumps({'event': 'state', 'key': p, 'value': DEFAULTS[p]}) + "\n").encode())
+            return None
+        return {'ok': False, 'error': f"unknown op {op}"}
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict) or not isinstance(request.get('key', ''), str):
+                        raise ValueError("expected an object")
+                    reply = self.handle_request(request, writer)
+                except ValueError as e:
+                    reply = {'ok': False, 'error': f"bad request: {e}"}
+                if reply is not None:
+                    writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self.subscribers.pop(writer, None)
+            writer.close()
+
+    async def serve(self, path=CONTROL_SOCKET):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        server = await asyncio.start_unix_server(self.serve_client, path, limit=MAX_LINE)
+        os.chmod(path, 0o660)
+        logger.info(f"Control plane listening on {path} ({len(self.values)} states loaded)")
+        async with server:
+            await server.serve_forever()
+
+
+# ==============================================================================
+#  CLIENTS
+# ==============================================================================
+
+def request(op, key, value=None, path=CONTROL_SOCKET, timeout=2):
+    """One request/response. Raises OSError if the control plane isn't running."""
+    message = {'op': op, 'key': key}
+    if value is not None:
+        message['value'] = value
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(message) + "\n").encode())
+        with sock.makefile('rb') as f:
+            line = f.readline(MAX_LINE)
+    if not line:
+        raise ConnectionError("control plane closed the connection")
+    return json.loads(line)
+
+
+def get(key, file=None, path=CONTROL_SOCKET):
+    """A state value from the control plane, or from its flag file if the plane is down"""
+    try:
+        reply = request('get', key, path=path)
+        if reply.get('ok'):
+            return reply['value']
+    except (OSError, ValueError):
+        pass
+    return read_compat(key, file)
+
+
+def set_value(key, value, file=None, path=CONTROL_SOCKET):
+    """
+    Set a state. Returns True if the control plane took it (subscribers know at
+    once). If the plane is down, the flag file is written and False returned.
+    Raises ValueError for a value the plane rejects.
+    """
+    try:
+        reply = request('set', key, value, path=path)
+    except (OSError, ValueError):
+        write_compat(key, value, path=file)
+        return False
+    if not reply.get('ok'):
+        raise ValueError(reply.get('error'))
+    return True
+
+
+def subscribe(keys, path=CONTROL_SOCKET):
+    """Yield (event, key, value) for the current values and every later change; ends when the plane goes away"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall((json.dumps({'op': 'subscribe', 'keys': list(keys)}) + "\n").encode())
+        with sock.makefile('rb') as f:
+            ack = json.loads(f.readline(MAX_LINE) or b'{}')
+            if not ack.get('ok'):
+                raise ConnectionError(ack.get('error') or "subscribe failed")
+            for line in f:
+                event = json.loads(line)
+                yield event.get('event'), event.get('key'), event.get('value')
+
+
+class Subscription:
+    """
+    Latest values of some state keys, kept current by a subscriber thread, so
+    reading one is a dict lookup. While the control plane is unreachable,
+    get() reads the flag file instead (files: key -> path, default compat_file).
+    """
+
+    def __init__(self, keys, files=None, path=CONTROL_SOCKET, on_change=None):
+        self.keys = list(keys)
+        self.files = files or {}
+        self.path = path
+        self.on_change = on_change     # on_change(key, value) from the subscriber thread
+        self.values = {}
+        self.connected = False
+        self._thread = None
+
+    def get(self, key):
+        if self.connected and key in self.values:
+            return self.values[key]
+        return read_compat(key, self.files.get(key))
+
+    def run(self):
+        logged = False
+        while True:
+            try:
+                for event, key, value in subscribe(self.keys, self.path):
+                    if not self.connected:
+                        self.connected = True
+                        logged = False
+                        logger.debug(f"Subscribed to {', '.join(self.keys)}")
+                    if event == 'state' and self.values.get(key) != value:
+                        self.values[key] = value
+                        if self.on_change:
+                            self.on_change(key, value)
+            except (OSError, ValueError) as e:
+                if not logged:
+                    logger.debug(f"Control plane unavailable ({e}) - reading flag files")
+                    logged = True
+            self.connected = False
+            time.sleep(RECONNECT_DELAY)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="control", daemon=True)
+            self._thread.start()
+        return self
+
+
+# ==============================================================================
+#  CLI
+# ==============================================================================
+
+def main():
+    args = sys.argv[1:]
+    usage = "usage: control_plane.py serve | get KEY | set KEY VALUE | publish KEY [VALUE] | subscribe KEY..."
+    if not args:
+        print(usage, file=sys.stderr)
+        return 2
+
+    if args[0] == 'serve':
+        from log_setup import setup_logging
+        setup_logging('Control')
+        try:
+            asyncio.run(ControlPlane().serve())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    try:
+        if args[0] == 'get' and len(args) == 2:
+            reply = request('get', args[1])
+            if reply.get('ok'):
+                print(reply['value'])
+                return 0
+        elif args[0] == 'set' and len(args) == 3:
+            reply = request('set', args[1], args[2])
+            if reply.get('ok'):
+                return 0
+        elif args[0] == 'publish' and len(args) in (2, 3):
+            reply = request('publish', args[1], args[2] if len(args) == 3 else None)
+            if reply.get('ok'):
+                return 0
+        elif args[0] == 'subscribe' and len(args) >= 2:
+            for _, key, value in subscribe(args[1:]):
+                print(key, '' if value is None else value, flush=True)
+            return 1
+        else:
+            print(usage, file=sys.stderr)
+            return 2
+    except (OSError, ValueError) as e:
+        print(f"control plane unavailable: {e}", file=sys.stderr)
+        return 1
+    except (KeyboardInterrupt, BrokenPipeError):
+        return 0
+    print(reply.get('error'), file=sys.stderr)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VantageCam health bus
+One process per camera probes the camera, the encoder and the RTMP ingest once
+and publishes a single snapshot that start.sh, the watchdog and the Docker
+healthcheck all read, instead of each of them probing on its own:
+
+  /dev/shm/vantagecam/<camera>/health   (key=value lines, replaced atomically)
+
+  updated        epoch of the last write (readers treat > STALE_AFTER as "bus down")
+  camera         healthy | hung | auth_failed | unreachable | error | unknown
+                 (rtsp_probe every HEALTH_CAMERA_INTERVAL seconds)
+  camera_detail, camera_ms, camera_since (epoch of the last camera state change)
+  mode           normal | fallback (start.sh's stream_mode, pushed by the control plane)
+  encoder        running | stalled | stopped | unknown
+  encoder_pid, encoder_frame, encoder_speed, encoder_age (seconds since frames advanced)
+  ingest         connected | closed | unknown (FFmpeg's RTMP socket)
+  youtube        live | offline | error | unknown (reported by the watchdog)
+  youtube_cause, youtube_age
+
+The <camera> directory is the camera name in multi-camera mode and "main"
+otherwise. The /proc and progress-file helpers here are shared with the watchdog.
+The bus also records the encoder, camera and fallback metrics (see metrics.py).
+"""
+
+import os
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+
+import rtsp_probe
+from metrics import Metrics
+from process_tracker import ProcessTracker
+from control_plane import Subscription, stream_mode_key
+from log_setup import setup_logging
+
+HEALTH_ROOT = "/dev/shm/vantagecam"
+STALE_AFTER = 10          # Seconds without a write before readers fall back to probing themselves
+STALL_AFTER = 15          # Seconds without a new frame before the encoder counts as stalled
+PUBLISH_INTERVAL = 1      # Encoder/ingest sampling and snapshot write interval
+METRICS_FLUSH_INTERVAL = 5
+
+logger = logging.getLogger(__name__)
+
+
+def default_health_dir():
+    return os.getenv("HEALTH_DIR") or os.path.join(HEALTH_ROOT, os.getenv("CAMERA_NAME") or "main")
+
+
+# ==============================================================================
+#  SNAPSHOT FILES
+# ==============================================================================
+
+def write_atomic(path, values):
+    """Write key=value lines to a temp file and rename it over path"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write("".join(f"{k}={'' if v is None else v}\n" for k, v in values.items()))
+    os.replace(tmp, path)
+
+
+def read_values(path):
+    try:
+        with open(path) as f:
+            return dict(line.rstrip('\n').partition('=')[::2] for line in f if '=' in line)
+    except OSError:
+        return None
+
+
+def read_snapshot(health_dir=None, max_age=STALE_AFTER):
+    """The current snapshot as a dict, or None if the bus isn't running (missing or stale)"""
+    values = read_values(os.path.join(health_dir or default_health_dir(), "health"))
+    if not values:
+        return None
+    try:
+        if time.time() - int(values.get('updated', 0)) > max_age:
+            return None
+    except ValueError:
+        return None
+    return values
+
+
+def report_youtube(status, cause=None, health_dir=None):
+    """Called by the watchdog after each status poll; folded into the next snapshot"""
+    health_dir = health_dir or default_health_dir()
+    try:
+        os.makedirs(health_dir, exist_ok=True)
+        write_atomic(os.path.join(health_dir, "youtube"),
+                     {'status': status, 'cause': cause or '', 'updated': int(time.time())})
+    except OSError as e:
+        logger.debug(f"Could not report YouTube status to the health bus: {e}")
+
+
+# ==============================================================================
+#  PROBE HELPERS
+# ==============================================================================
+
+class ProgressTail:
+    """
+    Incremental reader for FFmpeg's -progress file.
+
+    The file grows all day, so only the bytes appended since the last poll are
+    read, and only the latest complete block (ending in progress=...) is kept.
+    A recreated (new inode) or truncated file starts over from the beginning.
+    Per-poll I/O and memory are bounded by MAX_READ regardless of stream uptime.
+    """
+    MAX_READ = 64 * 1024     # More than this appended since last poll: jump to the tail
+    MAX_PARTIAL = 4096       # Cap on a line still being written
+
+    def __init__(self, path):
+        self.path = path
+        self.inode = None
+        self.last_frame = None
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.partial = b""
+        self.current = {}
+        self.latest = None
+        self.synced = True       # False after a jump until the next block boundary
+        self.last_frame = None
+
+    def poll(self):
+        """Read newly appended data. Returns (latest complete block or None, mtime or None)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.inode = None
+            self.reset()
+            return None, None
+
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            # start.sh recreated the file for a new FFmpeg (or it was truncated)
+            self.inode = st.st_ino
+            self.reset()
+
+        if st.st_size - self.offset > self.MAX_READ:
+            self.offset = st.st_size - self.MAX_READ
+            self.partial = b""
+            self.current = {}
+            self.synced = False
+
+        if st.st_size > self.offset:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read(st.st_size - self.offset)
+            self.offset += len(data)
+
+            lines = (self.partial + data).split(b'\n')
+            self.partial = lines.pop()[-self.MAX_PARTIAL:]
+            for line in lines:
+                key, sep, value = line.decode(errors='replace').strip().partition('=')
+                if not sep:
+                    continue
+                self.current[key] = value
+                if key == 'progress':
+                    if self.synced:
+                        self.latest = self.current
+                    self.synced = True
+                    self.current = {}
+
+        return self.latest, st.st_mtime
+
+
+def rtmp_port(url):
+    """Ingest port FFmpeg connects to for an rtmp:// or rtmps:// URL"""
+    parsed = urlparse(url)
+    return parsed.port or (443 if parsed.scheme == 'rtmps' else 1935)
+
+
+def has_established_socket(pid, port):
+    """
+    Whether the process holds an ESTABLISHED TCP connection to the given remote port:
+    socket inodes from /proc/<pid>/fd matched against its /proc/<pid>/net/tcp{,6}.
+    Returns None if the process can't be inspected.
+    """
+    inodes = set()
+    try:
+        for fd in os.listdir(f'/proc/{pid}/fd'):
+            try:
+                link = os.readlink(f'/proc/{pid}/fd/{fd}')
+            except OSError:
+                continue
+            if link.startswith('socket:['):
+                inodes.add(link[8:-1])
+    except OSError:
+        return None
+
+    for table in ('tcp', 'tcp6'):
+        try:
+            with open(f'/proc/{pid}/net/{table}') as f:
+                next(f)  # Header
+                for line in f:
+                    fields = line.split()
+                    # fields: sl local_address rem_address st ... inode (index 9)
+                    if fields[3] == '01' and fields[9] in inodes and int(fields[2].rsplit(':', 1)[1], 16) == port:
+                        return True
+        except (OSError, IndexError, ValueError, StopIteration):
+            continue
+    return False
+
+
+# ==============================================================================
+#  HEALTH BUS
+# ==============================================================================
+
+def _progress_number(block, key):
+    """Numeric value of a progress field ('1.02x', '2500.1kbits/s', '30.00'); 0 if missing or N/A"""
+    if not block:
+        return 0
+    value = block.get(key, '').strip().rstrip('x').replace('kbits/s', '')
+    try:
+        return float(value)
+    except ValueError:
+        return 0
+
+
+class HealthBus:
+    """Probes one camera's pipeline and publishes the snapshot every PUBLISH_INTERVAL"""
+
+    def __init__(self, run_dir, health_dir, rtsp_source, youtube_url, camera_interval=3, clock=time.time,
+                 metrics=None, camera_name=None):
+        self.health_dir = health_dir
+        self.path = os.path.join(health_dir, "health")
+        self.rtsp_source = rtsp_source
+        self.camera_interval = camera_interval
+        self.port = rtmp_port(youtube_url)
+        self.clock = clock
+        self.pid_file = os.path.join(run_dir, "youtube_restreamer.pid")
+        self.mode_key = stream_mode_key(camera_name)
+        self.mode = Subscription([self.mode_key], files={self.mode_key: os.path.join(run_dir, "stream_mode")})
+        self.tail = ProgressTail(os.path.join(run_dir, "ffmpeg_progress.txt"))
+
+        self.camera = {'camera': 'unknown', 'camera_detail': '', 'camera_ms': '', 'camera_since': int(clock())}
+        self.pid = None
+        self.processes = ProcessTracker('ffmpeg')
+        self.frame = None
+        self.frame_changed = clock()
+        self.block = None                 # Latest FFmpeg progress block for metrics
+        self.metrics = metrics
+        self.last_publish = None
+
+    # --------------------------------------------------------------------------
+    #  Camera (own thread - a hung camera can take the full probe timeout)
+    # --------------------------------------------------------------------------
+
+    def probe_camera(self):
+        if not self.rtsp_source:
+            return
+        result = rtsp_probe.probe(self.rtsp_source)
+        if self.metrics:
+            self.metrics.observe('vantagecam_api_latency_seconds', result.elapsed_ms / 1000, api='camera_rtsp')
+            if not result.healthy:
+                self.metrics.inc('vantagecam_api_errors_total', api='camera_rtsp')
+        now = int(self.clock())
+        if result.status != self.camera['camera']:
+            if result.healthy:
+                logger.info(f"Camera {result.status} ({result.elapsed_ms:.0f}ms)")
+            else:
+                logger.warning(f"Camera {result.status}: {result.detail}")
+            since = now
+        else:
+            since = self.camera['camera_since']
+        self.camera = {'camera': result.status, 'camera_detail': result.detail,
+                       'camera_ms': int(result.elapsed_ms), 'camera_since': since}
+
+    def camera_loop(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.probe_camera()
+            except Exception as e:
+                logger.error(f"Camera probe error: {e}")
+            time.sleep(max(self.camera_interval - (time.monotonic() - started), 0.5))
+
+    # --------------------------------------------------------------------------
+    #  Encoder and ingest
+    # --------------------------------------------------------------------------
+
+    def read_pid(self):
+        try:
+            with open(self.pid_file) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def read_mode(self):
+        return self.mode.get(self.mode_key)
+
+    def sample_encoder(self, mode):
+        now = self.clock()
+        pid = self.read_pid()
+        if pid != self.pid:
+            self.pid = pid
+            self.frame = None
+            self.frame_changed = now
+            self.block = None
+        values = {'encoder': 'unknown', 'encoder_pid': pid or '', 'encoder_frame': '', 'encoder_speed': '',
+                  'encoder_age': '', 'ingest': 'unknown'}
+        if pid is None:
+            return values
+        if not self.processes.running(pid):
+            return dict(values, encoder='stopped', ingest='closed')
+
+        block, _ = self.tail.poll()
+        self.block = block
+        if block and block.get('frame', '').isdigit():
+            frame = int(block['frame'])
+            if frame != self.frame:
+                self.frame = frame
+                self.frame_changed = now
+            values.update(encoder_frame=frame, encoder_speed=block.get('speed', '').rstrip('x'))
+        age = int(now - self.frame_changed)
+        values['encoder_age'] = age
+
+        if mode == 'fallback':
+            values['encoder'] = 'running'   # The BRB encoder writes no progress - being alive is all we can check
+        else:
+            values['encoder'] = 'stalled' if age > STALL_AFTER else 'running'
+
+        connected = has_established_socket(pid, self.port)
+        if connected is not None:
+            values['ingest'] = 'connected' if connected else 'closed'
+        return values
+
+    def youtube(self):
+        values = read_values(os.path.join(self.health_dir, "youtube")) or {}
+        try:
+            age = int(self.clock() - int(values['updated']))
+        except (KeyError, ValueError):
+            return {'youtube': 'unknown', 'youtube_cause': '', 'youtube_age': ''}
+        return {'youtube': values.get('status') or 'unknown', 'youtube_cause': values.get('cause', ''),
+                'youtube_age': age}
+
+    # --------------------------------------------------------------------------
+    #  Publishing
+    # --------------------------------------------------------------------------
+
+    def snapshot(self):
+        mode = self.read_mode()
+        values = {'updated': int(self.clock())}
+        values.update(self.camera)
+        values['mode'] = mode
+        values.update(self.sample_encoder(mode))
+        values.update(self.youtube())
+        return values
+
+    def publish(self):
+        values = self.snapshot()
+        write_atomic(self.path, values)
+        if self.metrics:
+            self.record(values)
+
+    def record(self, values):
+        """Per-second gauges and fallback time from the snapshot just published"""
+        now = self.clock()
+        fallback = values['mode'] == 'fallback'
+        if fallback and self.last_publish is not None:
+            # Capped so a suspended container doesn't book the whole pause as fallback
+            self.metrics.inc('vantagecam_fallback_seconds_total', min(now - self.last_publish, 5 * PUBLISH_INTERVAL))
+        self.last_publish = now
+
+        m = self.metrics
+        m.set('vantagecam_fallback_active', int(fallback))
+        if values['camera'] != 'unknown':
+            m.set('vantagecam_camera_up', int(values['camera'] == 'healthy'))
+        m.set('vantagecam_encoder_up', int(values['encoder'] == 'running'))
+
+        block = self.block if values['encoder'] == 'running' and not fallback else None
+        m.set('vantagecam_encoder_fps', _progress_number(block, 'fps'))
+        m.set('vantagecam_encoder_speed', _progress_number(block, 'speed'))
+        m.set('vantagecam_encoder_bitrate_kbps', _progress_number(block, 'bitrate'))
+        m.set('vantagecam_encoder_drop_frames', _progress_number(block, 'drop_frames'))
+        m.set('vantagecam_encoder_dup_frames', _progress_number(block, 'dup_frames'))
+
+    def run(self):
+        os.makedirs(self.health_dir, exist_ok=True)
+        logger.info(f"Publishing health to {self.path}")
+        threading.Thread(target=self.camera_loop, name="camera", daemon=True).start()
+        self.mode.start()
+        if self.metrics:
+            self.metrics.start(METRICS_FLUSH_INTERVAL)
+        while True:
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Health publish error: {e}")
+            time.sleep(PUBLISH_INTERVAL)
+
+
+def main():
+    camera_name = os.getenv("CAMERA_NAME", "")
+    setup_logging('HealthBus' + (f':{camera_name}' if camera_name else ''))
+    bus = HealthBus(
+        run_dir=os.getenv("VANTAGECAM_RUN_DIR", "/config"),
+        health_dir=default_health_dir(),
+        rtsp_source=os.getenv("RTSP_SOURCE", ""),
+        youtube_url=os.getenv("YOUTUBE_URL", "rtmp://a.rtmp.youtube.com/live2"),
+        camera_interval=float(os.getenv("HEALTH_CAMERA_INTERVAL", "3")),
+        metrics=Metrics(f"health-{camera_name or 'main'}", labels={'camera': camera_name or 'main'}),
+        camera_name=camera_name,
+    )
+    try:
+        bus.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VantageCam logging
+Shared logging setup for the Python components. Callers only put records on a
+queue; a listener thread does the console and file writes, so a slow disk never
+stalls the watchdog's event loop.
+
+- Log files rotate at LOG_MAX_SIZE_MB and at midnight, keeping LOG_BACKUPS
+  gzip-compressed generations (watchdog.log.1.gz, ...)
+- IncidentJournal appends one JSON object per line (detect, restart, verify,
+  recover, fallback_enter, ...) to incidents.jsonl through the same machinery,
+  so tools can answer "what happened" without parsing log prose. The journal
+  rotates by size only (INCIDENT_MAX_SIZE_MB, INCIDENT_BACKUPS), so it keeps
+  months of history for report.py instead of a week
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import queue
+import atexit
+import shutil
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_MAX_BYTES = int(float(os.getenv("LOG_MAX_SIZE_MB", "10")) * 1024 * 1024)
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "7"))
+INCIDENT_MAX_BYTES = int(float(os.getenv("INCIDENT_MAX_SIZE_MB", "5")) * 1024 * 1024)
+INCIDENT_BACKUPS = int(os.getenv("INCIDENT_BACKUPS", "20"))
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """Rotates when the file reaches max_bytes or (if daily) the day changes; old files are gzipped"""
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS, daily=True):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        self.daily = daily
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self._compress
+        try:
+            self.day = time.strftime('%Y%m%d', time.localtime(os.path.getmtime(filename)))
+        except OSError:
+            self.day = time.strftime('%Y%m%d')
+
+    def shouldRollover(self, record):
+        if self.daily and time.strftime('%Y%m%d') != self.day and os.path.exists(self.baseFilename) \
+                and os.path.getsize(self.baseFilename) > 0:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.day = time.strftime('%Y%m%d')
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+
+def _queued(handlers):
+    """A QueueHandler feeding handlers from a listener thread (stopped and drained at exit)"""
+    q = queue.SimpleQueue()
+    listener = QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return QueueHandler(q)
+
+
+def setup_logging(tag=None, log_file=None, level=logging.INFO):
+    """
+    Configure the root logger: '[time] [tag] message' to stdout and, if log_file
+    is given, to a rotating compressed file. Returns the root logger.
+    """
+    formatter = logging.Formatter(
+        '[%(asctime)s] ' + (f'[{tag}] ' if tag else '') + '%(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        try:
+            handlers.append(CompressingRotatingFileHandler(log_file))
+        except OSError as e:
+            print(f"Cannot write {log_file}: {e} - logging to stdout only", file=sys.stderr)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queued(handlers))
+    root.setLevel(level)
+    return root
+
+
+# ==============================================================================
+#  INCIDENT JOURNAL
+# ==============================================================================
+
+class IncidentJournal:
+    """
+    Append-only JSON Lines record of outages for one camera:
+
+      {"ts":1718000000.123,"camera":"main","source":"watchdog","event":"restart",...}
+
+    start.sh appends its fallback transitions to the same file. An outage is
+    a few hundred bytes, so the size-only rotation (5 MB x 20 gzip generations
+    by default) holds months of history even for a camera that flaps every few
+    minutes.
+    """
+
+    def __init__(self, path, camera=None, source="watchdog"):
+        self.path = path
+        self.camera = camera or "main"
+        self.source = source
+        self.logger = logging.getLogger(f"incidents.{camera or 'main'}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            try:
+                handler = CompressingRotatingFileHandler(path, INCIDENT_MAX_BYTES, INCIDENT_BACKUPS, daily=False)
+            except OSError as e:
+                logging.getLogger(__name__).warning(f"Incident journal disabled: {e}")
+                return
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(_queued([handler]))
+
+    def record(self, event, **fields):
+        entry = {'ts': round(time.time(), 3), 'camera': self.camera, 'source': self.source, 'event': event}
+        entry.update({k: v for k, v in fields.items() if v is not None})
+        self.logger.info(json.dumps(entry, separators=(',', ':'), default=str))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VantageCam metrics
+Every process (watchdog, health bus, weather renderer) records counters, gauges
+and histograms into its own snapshot file, and audio_api.py serves them all on
+/metrics in the Prometheus text format:
+
+  /dev/shm/vantagecam/metrics/<source>.json
+
+Snapshots are merged under a lock, so short-lived processes (weather.py runs
+once per overlay update) and several processes sharing a source add up instead
+of overwriting each other. Counters and histograms survive process restarts
+(they live until the container restarts); gauges from a source that stopped
+writing are dropped after GAUGE_STALE_AFTER.
+
+Every series is declared in METRICS below - that is the list of what we export.
+"""
+
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_ROOT = "/dev/shm/vantagecam/metrics"
+GAUGE_STALE_AFTER = 300   # Seconds a gauge is exported after its source last wrote
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+OUTAGE_BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+PHASE_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    # Watchdog
+    'vantagecam_restarts_total': ('counter', "Stream restarts started by the watchdog, by cause", None),
+    'vantagecam_recovery_attempt': ('gauge', "Current backoff attempt (0 = stable)", None),
+    'vantagecam_youtube_live': ('gauge', "1 while YouTube reports the stream live", None),
+    'vantagecam_time_to_detect_seconds': ('histogram', "First failure signal to recovery start", OUTAGE_BUCKETS),
+    'vantagecam_time_to_recover_seconds': ('histogram', "Recovery start to the stream being live again", OUTAGE_BUCKETS),
+    'vantagecam_recovery_phase_seconds': ('histogram', "Time spent in each recovery phase", PHASE_BUCKETS),
+    'vantagecam_youtube_quota_spent': ('gauge', "YouTube Data API units spent today", None),
+    # Health bus
+    'vantagecam_fallback_active': ('gauge', "1 while the BRB fallback screen is streaming", None),
+    'vantagecam_fallback_seconds_total': ('counter', "Time spent streaming the fallback screen", None),
+    'vantagecam_camera_up': ('gauge', "1 while the camera answers RTSP DESCRIBE", None),
+    'vantagecam_encoder_up': ('gauge', "1 while FFmpeg is running and producing frames", None),
+    'vantagecam_encoder_fps': ('gauge', "FFmpeg output frame rate", None),
+    'vantagecam_encoder_speed': ('gauge', "FFmpeg encoding speed (1.0 = realtime)", None),
+    'vantagecam_encoder_bitrate_kbps': ('gauge', "FFmpeg output bitrate", None),
+    'vantagecam_encoder_drop_frames': ('gauge', "Frames dropped by the current FFmpeg process", None),
+    'vantagecam_encoder_dup_frames': ('gauge', "Frames duplicated by the current FFmpeg process", None),
+    # Overlays
+    'vantagecam_overlay_render_seconds': ('histogram', "Time to render an overlay image, by kind", LATENCY_BUCKETS),
+    # External calls (camera probe, YouTube, weather APIs, Discord)
+    'vantagecam_api_latency_seconds': ('histogram', "External request latency, by API", LATENCY_BUCKETS),
+    'vantagecam_api_errors_total': ('counter', "Failed external requests, by API", None),
+    # Status service
+    'vantagecam_status_reads_total': ('counter', "Status reads, by how they were served (cached, fetched, joined)", None),
+    'vantagecam_status_subscribers': ('gauge', "Open long-poll and event-stream connections", None),
+}
+
+
+def metrics_root():
+    return os.getenv("METRICS_DIR", METRICS_ROOT)
+
+
+def _key(labels):
+    """Label dict -> stable JSON key"""
+    return json.dumps(sorted(labels.items()))
+
+
+class Metrics:
+    """Metrics recorded by one process, flushed to <root>/<source>.json"""
+
+    def __init__(self, source, labels=None, root=None, clock=time.time):
+        self.source = source
+        self.labels = {k: v for k, v in (labels or {}).items() if v}   # Added to every series
+        self.root = root or metrics_root()
+        self.path = os.path.join(self.root, f"{source}.json")
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._deltas = {}     # (name, key) -> counter increment or histogram [counts..., sum, count]
+        self._gauges = {}     # (name, key) -> value
+        self._thread = None
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            k = (name, _key(labels))
+            self._deltas[k] = self._deltas.get(k, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        with self._lock:
+            k = (name, _key(labels))
+            hist = self._deltas.setdefault(k, [0] * (len(buckets) + 2))
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of a with-block (also when it raises)"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def timed_call(self, api, func, *args, **kwargs):
+        """Call func, recording its latency and failures under api"""
+        started = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            self.inc('vantagecam_api_errors_total', api=api)
+            raise
+        finally:
+            self.observe('vantagecam_api_latency_seconds', time.monotonic() - started, api=api)
+
+    # --------------------------------------------------------------------------
+    #  Persistence
+    # --------------------------------------------------------------------------
+
+    def flush(self):
+        """Merge what was recorded since the last flush into the snapshot file"""
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+            gauges = dict(self._gauges)
+        if not deltas and not gauges:
+            return
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with open(f"{self.path}.lock", 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                snap = self._read()
+                series = snap.setdefault('series', {})
+                for (name, key), delta in deltas.items():
+                    values = series.setdefault(name, {})
+                    if isinstance(delta, list):
+                        current = values.get(key)
+                        values[key] = [a + b for a, b in zip(current, delta)] \
+                            if current and len(current) == len(delta) else delta
+                    else:
+                        values[key] = values.get(key, 0) + delta
+                for (name, key), value in gauges.items():
+                    snap.setdefault('gauges', {}).setdefault(name, {})[key] = value
+                snap['labels'] = self.labels
+                snap['updated'] = self.clock()
+                tmp = f"{self.path}.tmp"
+                with open(tmp, 'w') as f:
+                    json.dump(snap, f)
+                os.replace(tmp, self.path)
+        except OSError as e:
+            logger.debug(f"Could not write metrics: {e}")
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                snap = json.load(f)
+            return snap if isinstance(snap, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def start(self, interval=10):
+        """Flush every interval seconds from a daemon thread (long-running processes)"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.flush()
+        if self._thread is None:
+            self._thread = threading.Thread(target=loop, name="metrics", daemon=True)
+            self._thread.start()
+
+
+# ==============================================================================
+#  PROMETHEUS EXPOSITION
+# ==============================================================================
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(root=None, now=None):
+    """All snapshot files under root in the Prometheus text format (version 0.0.4)"""
+    root = root or metrics_root()
+    now = now or time.time()
+    collected = {name: [] for name in METRICS}
+    try:
+        files = sorted(f for f in os.listdir(root) if f.endswith('.json'))
+    except OSError:
+        files = []
+
+    for filename in files:
+        try:
+            with open(os.path.join(root, filename)) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue
+        base = list((snap.get('labels') or {}).items())
+        fresh = now - snap.get('updated', 0) <= GAUGE_STALE_AFTER
+        sections = [snap.get('series', {})] + ([snap.get('gauges', {})] if fresh else [])
+        for section in sections:
+            for name, values in section.items():
+                if name not in collected:
+                    continue
+                for key, value in values.items():
+                    labels = sorted(base + [tuple(kv) for kv in json.loads(key)])
+                    collected[name].append((labels, value))
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        if not collected[name]:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in collected[name]:
+            if kind == 'histogram':
+                # Bucket counts are already cumulative (<= le), then sum and count
+                for bound, count in zip(buckets, value):
+                    lines.append(f"{name}_bucket{_format_labels(labels + [('le', _number(float(bound)))])} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_number(float(value[-2]))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VantageCam Discord notifier
+Sends webhook alerts from a background thread so Discord being slow, down or
+rate-limiting never delays the watchdog's recovery.
+
+- send() only queues; one worker thread posts the messages in order
+- 429 responses are retried after the Retry-After the webhook asks for; network
+  and 5xx errors are retried with backoff; other 4xx are dropped (bad webhook)
+- Alerts of the same group (e.g. stream offline/recovered) are coalesced: the
+  first goes out right away, anything else in that group within the coalesce
+  window is sent as one summary at the end of it - flapping becomes one message
+- Unsent alerts are kept in a spool file and sent after a restart
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "VantageCam-Watchdog/2.8.1"
+
+RED = 16711680
+YELLOW = 16776960
+GREEN = 65280
+
+
+class Notifier:
+    """Queue + worker thread for Discord webhook alerts"""
+    RETRY_DELAYS = (5, 15, 30, 60, 120, 300)   # Network/5xx retry backoff, last one repeats
+    MAX_SUMMARY_LINES = 10
+
+    def __init__(self, webhook_url, user_id=None, footer="VantageCam Watchdog", spool_path=None,
+                 coalesce_window=120, timeout=10, clock=time.time, metrics=None):
+        self.webhook_url = webhook_url
+        self.user_id = user_id
+        self.footer = footer
+        self.spool_path = spool_path
+        self.coalesce_window = coalesce_window
+        self.timeout = timeout
+        self.clock = clock
+        self.metrics = metrics    # metrics.Metrics recording webhook latency (optional)
+
+        self._cond = threading.Condition()
+        self._queue = []          # Alerts ready to send, in order
+        self._held = {}           # group -> alerts waiting for the end of the coalesce window
+        self._window_end = {}     # group -> clock() when its window closes
+        self._sending = None      # Alert being posted right now
+        self._thread = None
+        self._load_spool()
+
+    @property
+    def configured(self):
+        return bool(self.webhook_url)
+
+    # --------------------------------------------------------------------------
+    #  Producer side (any thread, never blocks on the network)
+    # --------------------------------------------------------------------------
+
+    def send(self, title, message, color=RED, mention_user=True, group=None):
+        """Queue an alert. Alerts sharing a group are coalesced within the window."""
+        if not self.configured:
+            return False
+        alert = {'title': title, 'message': message, 'color': color, 'mention': mention_user,
+                 'group': group, 'created': self.clock()}
+        with self._cond:
+            now = self.clock()
+            if group and now < self._window_end.get(group, 0):
+                self._held.setdefault(group, []).append(alert)
+            else:
+                if group:
+                    self._window_end[group] = now + self.coalesce_window
+                self._queue.append(alert)
+            self._save_spool()
+            self._cond.notify()
+        self.start()
+        return True
+
+    def send_now(self, title, message, color=RED, mention_user=True):
+        """Post synchronously (startup webhook check). Returns True on success."""
+        if not self.configured:
+            return False
+        alert = {'title': title, 'message': message, 'color': color, 'mention': mention_user,
+                 'group': None, 'created': self.clock()}
+        return self._post(alert)[0] == 'sent'
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue) + sum(len(a) for a in self._held.values()) + (1 if self._sending else 0)
+
+    def flush(self, timeout=10):
+        """Release held summaries and wait up to timeout for the queue to drain"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            for group in list(self._held):
+                self._release(group)
+            self._cond.notify()
+            while (self._queue or self._sending) and time.monotonic() < deadline:
+                self._cond.wait(max(deadline - time.monotonic(), 0.01))
+            return not (self._queue or self._sending)
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+                self._thread.start()
+
+    # --------------------------------------------------------------------------
+    #  Coalescing
+    # --------------------------------------------------------------------------
+
+    def _release(self, group):
+        """Turn a group's held alerts into one summary at the end of the queue (lock held)"""
+        held = self._held.pop(group, [])
+        self._window_end.pop(group, None)
+        if len(held) == 1:
+            self._queue.append(held[0])
+        elif held:
+            self._queue.append(self._summary(held))
+            # The summary opens a new window so continued flapping keeps being batched
+            self._window_end[group] = self.clock() + self.coalesce_window
+
+    def _summary(self, alerts):
+        latest = alerts[-1]
+        lines = [f"- {datetime.fromtimestamp(a['created']).strftime('%H:%M:%S')} {a['title']}"
+                 for a in alerts[-self.MAX_SUMMARY_LINES:]]
+        if len(alerts) > self.MAX_SUMMARY_LINES:
+            lines.insert(0, f"- ... {len(alerts) - self.MAX_SUMMARY_LINES} earlier")
+        span = int(latest['created'] - alerts[0]['created'])
+        return {
+            'title': f"{latest['title']} (+{len(alerts) - 1} more)",
+            'message': (f"**{len(alerts)} alerts in {span}s:**\n" + "\n".join(lines) +
+                        f"\n\n**Latest:**\n{latest['message']}"),
+            'color': latest['color'],
+            'mention': any(a['mention'] for a in alerts),
+            'group': latest['group'],
+            'created': latest['created'],
+        }
+
+    # --------------------------------------------------------------------------
+    #  Worker
+    # --------------------------------------------------------------------------
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._cond:
+                while not self._queue:
+                    now = self.clock()
+                    for group, end in list(self._window_end.items()):
+                        if now >= end:
+                            if group in self._held:
+                                self._release(group)
+                            else:
+                                del self._window_end[group]
+                    if self._queue:
+                        break
+                    ends = [end for group, end in self._window_end.items() if group in self._held]
+                    self._cond.wait(max(min(ends) - now, 0.05) if ends else None)
+                self._sending = self._queue.pop(0)
+                alert = self._sending
+
+            result, delay = self._post(alert)
+
+            with self._cond:
+                if result == 'retry':
+                    self._queue.insert(0, alert)
+                self._sending = None
+                self._save_spool()
+                self._cond.notify_all()
+
+            if result == 'retry':
+                if delay is None:
+                    delay = self.RETRY_DELAYS[min(failures, len(self.RETRY_DELAYS) - 1)]
+                    failures += 1
+                time.sleep(delay)
+            else:
+                failures = 0
+
+    def _post(self, alert):
+        """POST one alert. Returns ('sent' | 'retry' | 'dropped', retry delay or None)."""
+        started = time.monotonic()
+        result = self._post_once(alert)
+        if self.metrics:
+            self.metrics.observe('vantagecam_api_latency_seconds', time.monotonic() - started, api='discord')
+            if result[0] != 'sent':
+                self.metrics.inc('vantagecam_api_errors_total', api='discord')
+        return result
+
+    def _post_once(self, alert):
+        embed = {
+            "title": alert['title'],
+            "description": alert['message'][:4096],
+            "color": alert['color'],
+            "timestamp": datetime.fromtimestamp(alert['created'], timezone.utc).isoformat().replace('+00:00', 'Z'),
+            "footer": {"text": self.footer}
+        }
+        payload = {
+            "content": f"<@{self.user_id}>" if alert['mention'] and self.user_id else "",
+            "embeds": [embed]
+        }
+        req = Request(self.webhook_url, data=json.dumps(payload).encode(), method='POST')
+        req.add_header('Content-Type', 'application/json')
+        req.add_header('User-Agent', USER_AGENT)
+        try:
+            with urlopen(req, timeout=self.timeout) as response:
+                response.read()
+                return 'sent', None
+        except HTTPError as e:
+            if e.code == 429:
+                delay = self._retry_after(e)
+                logger.warning(f"Discord rate limit hit - retrying in {delay:.1f}s")
+                return 'retry', delay
+            if e.code >= 500:
+                logger.warning(f"Discord returned {e.code} - will retry")
+                return 'retry', None
+            logger.error(f"Discord rejected alert '{alert['title']}': HTTP {e.code}")
+            return 'dropped', None
+        except Exception as e:
+            logger.warning(f"Failed to send Discord alert ({e}) - will retry")
+            return 'retry', None
+
+    @staticmethod
+    def _retry_after(err):
+        """Seconds to wait from a 429: Retry-After header, else the JSON body's retry_after"""
+        try:
+            return max(float(err.headers.get('Retry-After')), 0.1)
+        except (TypeError, ValueError):
+            pass
+        try:
+            return max(float(json.loads(err.read().decode()).get('retry_after', 1)), 0.1)
+        except Exception:
+            return 5.0
+
+    # --------------------------------------------------------------------------
+    #  Spool (unsent alerts survive restarts)
+    # --------------------------------------------------------------------------
+
+    def _save_spool(self):
+        """Write everything not yet sent (lock held)"""
+        if not self.spool_path:
+            return
+        unsent = ([self._sending] if self._sending else []) + self._queue + \
+            [a for held in self._held.values() for a in held]
+        try:
+            if not unsent:
+                if os.path.exists(self.spool_path):
+                    os.remove(self.spool_path)
+                return
+            tmp = f"{self.spool_path}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(unsent, f)
+            os.replace(tmp, self.spool_path)
+        except OSError as e:
+            logger.debug(f"Could not write alert spool: {e}")
+
+    def _load_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        try:
+            with open(self.spool_path) as f:
+                self._queue = [a for a in json.load(f) if isinstance(a, dict) and 'title' in a]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable alert spool: {e}")
+            return
+        if self._queue:
+            logger.info(f"Resending {len(self._queue)} alert(s) left unsent by the previous run")
+            for alert in self._queue:
+                alert.setdefault('color', RED)
+                alert.setdefault('mention', False)
+                alert.setdefault('created', self.clock())
+                alert['group'] = None  # Send as-is, don't open coalesce windows
+            self.start()
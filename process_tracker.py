@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VantageCam process tracking
+Follows the encoder through Linux pidfds instead of bare PIDs from
+youtube_restreamer.pid:
+
+- A pidfd refers to one process, not to a number - if FFmpeg exits and the PID
+  is handed to something else, signals sent through the pidfd fail instead of
+  hitting the new process
+- The command line is checked when the pidfd is opened, so a stale PID file
+  pointing at a recycled PID is recognised as "not FFmpeg"
+- The pidfd becomes readable the moment the process exits (even before start.sh
+  reaps it), so exit is seen at once and the SIGINT -> SIGTERM -> SIGKILL
+  escalation waits with poll() instead of sleep loops
+
+Kernels without pidfd support (< 5.3) fall back to PID checks.
+"""
+
+import os
+import time
+import errno
+import select
+import signal
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Signal and seconds to wait for the exit after it
+STOP_ESCALATION = ((signal.SIGINT, 5), (signal.SIGTERM, 3), (signal.SIGKILL, 1))
+
+
+def cmdline(pid):
+    """The process's argv, or None if it is gone (or a zombie, whose cmdline is empty)"""
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            args = f.read().decode(errors='replace').split('\0')[:-1]
+        return args or None
+    except OSError:
+        return None
+
+
+def matches(args, expect):
+    """Whether argv[0] is the expected program (e.g. 'ffmpeg' matches /usr/bin/ffmpeg)"""
+    return bool(args) and (expect is None or expect in os.path.basename(args[0]))
+
+
+def find_pids(expect, *words):
+    """PIDs of running `expect` processes whose arguments mention all words (pgrep -f without pgrep)"""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        args = cmdline(entry)
+        if matches(args, expect) and all(any(w in a for a in args) for w in words):
+            pids.append(int(entry))
+    return pids
+
+
+class TrackedProcess:
+    """
+    One process pinned by a pidfd. Raises ProcessLookupError if the PID is not
+    running or is not an `expect` process.
+    """
+
+    def __init__(self, pid, expect=None):
+        self.pid = pid
+        self.expect = expect
+        self.fd = None
+        try:
+            self.fd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            raise
+        except (AttributeError, OSError) as e:
+            if isinstance(e, OSError) and e.errno != errno.ENOSYS:
+                raise
+            # No pidfd support - checks below fall back to the PID
+        # Checked after opening: if this is the right process now, the pidfd stays
+        # bound to it whatever happens to the number later
+        if not matches(cmdline(pid), expect) or self.exited():
+            self.close()
+            raise ProcessLookupError(f"PID {pid} is not a running {expect or 'process'}")
+
+    def fileno(self):
+        """The pidfd (readable once the process exited), or None without pidfd support"""
+        return self.fd
+
+    def exited(self):
+        return self.wait(0)
+
+    def wait(self, timeout=None):
+        """Block until the process exits or timeout passes. Returns True if it exited."""
+        if self.fd is not None:
+            poller = select.poll()
+            poller.register(self.fd, select.POLLIN)
+            return bool(poller.poll(None if timeout is None else timeout * 1000))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                with open(f'/proc/{self.pid}/stat') as f:
+                    if f.read().rpartition(')')[2].split()[0] == 'Z':
+                        return True
+            except (OSError, IndexError):
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+
+    def send_signal(self, sig):
+        """Signal the process; ProcessLookupError if it already exited"""
+        if self.fd is not None:
+            signal.pidfd_send_signal(self.fd, sig)
+        else:
+            os.kill(self.pid, sig)
+
+    def stop(self, escalation=STOP_ESCALATION, name="process"):
+        """
+        Send each signal in turn until the process exits. Returns the signal
+        that stopped it, or None if it survived SIGKILL's wait.
+        """
+        for sig, wait in escalation:
+            try:
+                self.send_signal(sig)
+            except ProcessLookupError:
+                logger.info(f"{name} already stopped")
+                return None
+            logger.info(f"Sent {sig.name} to {name} (PID: {self.pid})")
+            if self.wait(wait):
+                logger.info(f"{name} stopped after {sig.name}")
+                return sig
+            logger.warning(f"{name} still running {wait}s after {sig.name}")
+        return None
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+class ProcessTracker:
+    """
+    Keeps a TrackedProcess for whatever PID the caller currently sees (usually
+    the PID file's), reopening only when the PID changes. Only a successful open
+    is kept: start.sh writes the PID right after forking, while the child may
+    still be bash on its way to exec'ing taskset/ffmpeg, so a PID that isn't
+    `expect` yet is retried on every call until it is (or the PID changes).
+    """
+
+    def __init__(self, expect='ffmpeg'):
+        self.expect = expect
+        self.pid = None
+        self.process = None
+
+    def get(self, pid):
+        """TrackedProcess for pid, or None if that PID isn't a live `expect` process"""
+        if pid != self.pid:
+            if self.process:
+                self.process.close()
+            self.pid, self.process = pid, None
+        if self.process is None and pid is not None:
+            try:
+                self.process = TrackedProcess(pid, self.expect)
+            except (ProcessLookupError, OSError):
+                pass
+        return self.process
+
+    def running(self, pid):
+        process = self.get(pid)
+        return process is not None and not process.exited()
+
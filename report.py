@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VantageCam uptime report
+Reads the incident journals (incidents.jsonl and its rotated .gz generations,
+written by the watchdog and start.sh) and prints, per camera, for a window:
+
+  uptime %          share of the observed time the stream was not in an outage
+                    (detect -> recover, clipped to the window)
+  MTTR              mean detect -> recover time of outages that ended in the window
+  time to detect    first failure signal -> first restart
+  time in fallback  fallback_enter -> fallback_exit (the BRB screen was on air)
+  restarts          per cause
+  recovery phases   mean time in each timed step of the watchdog's recoveries
+
+Events are streamed one line at a time, so months of history take constant
+memory. If the journal starts after the window start (retention is set by
+INCIDENT_MAX_SIZE_MB x INCIDENT_BACKUPS), the report says so, since the
+figures then cover only the observed part of the window.
+
+Usage: report.py [--since 7d] [--until now] [--dir /config] [--camera NAME] [--json]
+"""
+
+import os
+import re
+import sys
+import glob
+import gzip
+import json
+import time
+import argparse
+from datetime import datetime
+from collections import Counter
+
+
+# ==============================================================================
+#  INPUT
+# ==============================================================================
+
+def journal_files(run_dir):
+    """Journal files oldest first: incidents.jsonl.N.gz ... .1.gz, then incidents.jsonl"""
+    files = []
+    for base in [os.path.join(run_dir, "incidents.jsonl")] + \
+            sorted(glob.glob(os.path.join(run_dir, "cameras", "*", "incidents.jsonl"))):
+        rotated = []
+        for path in glob.glob(f"{base}.*.gz"):
+            match = re.search(r'\.(\d+)\.gz$', path)
+            if match:
+                rotated.append((int(match.group(1)), path))
+        files += [path for _, path in sorted(rotated, reverse=True)]
+        if os.path.exists(base):
+            files.append(base)
+    return files
+
+
+def read_events(paths):
+    """Yield journal entries from each file in turn, skipping lines that don't parse"""
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                        event['ts'] = float(event['ts'])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    yield event
+        except (OSError, EOFError) as e:
+            print(f"Skipping {path}: {e}", file=sys.stderr)
+
+
+def parse_time(value, now):
+    """'7d', '12h', '30m', 'now', an epoch or an ISO date -> epoch seconds"""
+    if value == 'now':
+        return now
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([dhm])', value)
+    if match:
+        return now - float(match.group(1)) * {'d': 86400, 'h': 3600, 'm': 60}[match.group(2)]
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+# ==============================================================================
+#  AGGREGATION
+# ==============================================================================
+
+class CameraReport:
+    """Running totals for one camera - O(1) memory however long the history is"""
+
+    def __init__(self, camera, since, until):
+        self.camera = camera
+        self.since = since
+        self.until = until
+        self.first_ts = None
+        self.last_ts = None
+
+        self.outage_start = None
+        self.outage_cause = None
+        self.outage_restarted = False
+        self.fallback_start = None
+
+        self.outages = 0
+        self.ongoing = False
+        self.downtime = 0.0
+        self.downtime_by_cause = Counter()
+        self.outages_by_cause = Counter()
+        self.repaired = 0
+        self.repair_total = 0.0
+        self.repair_max = 0.0
+        self.detected = 0
+        self.detect_total = 0.0
+        self.detect_max = 0.0
+        self.fallback_time = 0.0
+        self.fallbacks = 0
+        self.restarts = Counter()
+        self.phase_total = Counter()     # Insertion order = order phases were first seen
+        self.phase_count = Counter()
+
+    def in_window(self, ts):
+        return self.since <= ts < self.until
+
+    def overlap(self, start, end):
+        return max(0.0, min(end, self.until) - max(start, self.since))
+
+    def feed(self, event):
+        ts, kind = event['ts'], event.get('event')
+        if self.first_ts is None:
+            self.first_ts = ts
+
+        if kind == 'detect':
+            if self.outage_start is None:
+                self.outage_start = ts
+                self.outage_cause = event.get('cause') or 'unknown'
+                self.outage_restarted = False
+        elif kind == 'restart':
+            if self.in_window(ts):
+                self.restarts[event.get('cause') or 'unknown'] += 1
+            if self.outage_start is not None and not self.outage_restarted:
+                self.outage_restarted = True
+                if self.in_window(ts):
+                    ttd = ts - self.outage_start
+                    self.detected += 1
+                    self.detect_total += ttd
+                    self.detect_max = max(self.detect_max, ttd)
+        elif kind == 'recover':
+            if self.in_window(ts) and isinstance(event.get('phases'), dict):
+                for phase, seconds in event['phases'].items():
+                    if isinstance(seconds, (int, float)):
+                        self.phase_total[phase] += seconds
+                        self.phase_count[phase] += 1
+            self.close_outage(ts, repaired=True)
+        elif kind == 'stop':
+            # Nobody watched the stream after this - don't count it as down
+            self.close_outage(ts)
+        elif kind == 'start':
+            # Watchdog (re)started without a stop: it crashed or the container was killed
+            if self.last_ts is not None:
+                self.close_outage(self.last_ts)
+                self.close_fallback(self.last_ts)
+        elif kind == 'fallback_enter':
+            if self.fallback_start is None:
+                self.fallback_start = ts
+                if self.in_window(ts):
+                    self.fallbacks += 1
+        elif kind == 'fallback_exit':
+            self.close_fallback(ts)
+        self.last_ts = ts
+
+    def close_outage(self, end, repaired=False):
+        if self.outage_start is None:
+            return
+        down = self.overlap(self.outage_start, end)
+        if down > 0 or self.in_window(self.outage_start):
+            self.outages += 1
+            self.outages_by_cause[self.outage_cause] += 1
+            self.downtime += down
+            self.downtime_by_cause[self.outage_cause] += down
+        if repaired and self.in_window(end):
+            duration = end - self.outage_start
+            self.repaired += 1
+            self.repair_total += duration
+            self.repair_max = max(self.repair_max, duration)
+        self.outage_start = None
+
+    def close_fallback(self, end):
+        if self.fallback_start is not None:
+            self.fallback_time += self.overlap(self.fallback_start, end)
+            self.fallback_start = None
+
+    def finish(self):
+        """Outages/fallbacks still open at the end of the history run to the window end"""
+        if self.outage_start is not None and self.outage_start < self.until:
+            self.ongoing = True
+            self.close_outage(self.until)
+        if self.fallback_start is not None:
+            self.close_fallback(self.until)
+
+    def observed(self):
+        """Seconds of the window the journal covers (history may start inside it)"""
+        if self.first_ts is None:
+            return 0.0
+        return max(0.0, self.until - max(self.since, self.first_ts))
+
+    def summary(self):
+        observed = self.observed()
+        return {
+            'camera': self.camera,
+            'history_start': self.first_ts,
+            'history_truncated': self.first_ts is not None and self.first_ts > self.since,
+            'observed_seconds': round(observed),
+            'uptime_percent': round(100 * (1 - self.downtime / observed), 3) if observed else None,
+            'downtime_seconds': round(self.downtime),
+            'outages': self.outages,
+            'ongoing': self.ongoing,
+            'mttr_seconds': round(self.repair_total / self.repaired, 1) if self.repaired else None,
+            'mttr_max_seconds': round(self.repair_max, 1) if self.repaired else None,
+            'recovered': self.repaired,
+            'time_to_detect_seconds': round(self.detect_total / self.detected, 1) if self.detected else None,
+            'time_to_detect_max_seconds': round(self.detect_max, 1) if self.detected else None,
+            'fallback_seconds': round(self.fallback_time),
+            'fallback_percent': round(100 * self.fallback_time / observed, 3) if observed else None,
+            'fallbacks': self.fallbacks,
+            'restarts': dict(self.restarts.most_common()),
+            'phase_mean_seconds': {phase: round(total / self.phase_count[phase], 1)
+                                   for phase, total in self.phase_total.items()},
+            'outages_by_cause': {cause: {'count': count, 'downtime_seconds': round(self.downtime_by_cause[cause])}
+                                 for cause, count in self.outages_by_cause.most_common()},
+        }
+
+
+def build_report(events, since, until, camera=None):
+    reports = {}
+    for event in events:
+        name = event.get('camera') or 'main'
+        if camera and name != camera:
+            continue
+        if event['ts'] >= until:
+            continue
+        if name not in reports:
+            reports[name] = CameraReport(name, since, until)
+        reports[name].feed(event)
+    for report in reports.values():
+        report.finish()
+    return [reports[name].summary() for name in sorted(reports)]
+
+
+# ==============================================================================
+#  OUTPUT
+# ==============================================================================
+
+def fmt_duration(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    if seconds < 86400:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    return f"{seconds // 86400}d {seconds % 86400 // 3600:02d}h"
+
+
+def print_report(summaries, since, until):
+    fmt = '%Y-%m-%d %H:%M'
+    print(f"VantageCam report: {datetime.fromtimestamp(since).strftime(fmt)} -> "
+          f"{datetime.fromtimestamp(until).strftime(fmt)} ({fmt_duration(until - since)})")
+    if not summaries:
+        print("\nNo incident history in this window.")
+        return
+    for s in summaries:
+        print(f"\n[{s['camera']}]  observed {fmt_duration(s['observed_seconds'])}")
+        if s['history_truncated']:
+            print(f"  History starts {datetime.fromtimestamp(s['history_start']).strftime(fmt)} - "
+                  f"figures cover only the observed time")
+        if s['uptime_percent'] is None:
+            print("  No data")
+            continue
+        ongoing = ", 1 still open" if s["ongoing"] else ""
+        print(f"  Uptime:            {s['uptime_percent']:.2f}%  "
+              f"(down {fmt_duration(s['downtime_seconds'])} in {s['outages']} outages{ongoing})")
+        print(f"  MTTR:              {fmt_duration(s['mttr_seconds'])}  "
+              f"(max {fmt_duration(s['mttr_max_seconds'])}, {s['recovered']} recovered)")
+        print(f"  Time to detect:    {fmt_duration(s['time_to_detect_seconds'])}  "
+              f"(max {fmt_duration(s['time_to_detect_max_seconds'])})")
+        print(f"  Time in fallback:  {fmt_duration(s['fallback_seconds'])}  "
+              f"({s['fallback_percent']:.2f}%, {s['fallbacks']} switches)")
+        restarts = ", ".join(f"{cause} {count}" for cause, count in s['restarts'].items())
+        print(f"  Restarts:          {sum(s['restarts'].values())}" + (f"  ({restarts})" if restarts else ""))
+        causes = ", ".join(f"{cause} {v['count']} ({fmt_duration(v['downtime_seconds'])})"
+                           for cause, v in s['outages_by_cause'].items())
+        if causes:
+            print(f"  Outages by cause:  {causes}")
+        phases = ", ".join(f"{phase} {fmt_duration(mean)}" for phase, mean in s['phase_mean_seconds'].items())
+        if phases:
+            print(f"  Recovery phases:   {phases}  (mean)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Uptime, MTTR and restart report from the incident journals")
+    parser.add_argument('--since', default='7d', help="Window start: 7d, 24h, 30m, epoch or ISO date (default 7d)")
+    parser.add_argument('--until', default='now', help="Window end (default now)")
+    parser.add_argument('--dir', default=os.getenv("VANTAGECAM_RUN_DIR", "/config"),
+                        help="Config directory holding incidents.jsonl (and cameras/*/)")
+    parser.add_argument('--camera', help="Only this camera")
+    parser.add_argument('--json', action='store_true', help="Machine-readable output")
+    args = parser.parse_args()
+
+    now = time.time()
+    try:
+        since, until = parse_time(args.since, now), parse_time(args.until, now)
+    except ValueError as e:
+        parser.error(f"bad time: {e}")
+    if since >= until:
+        parser.error("--since must be before --until")
+
+    summaries = build_report(read_events(journal_files(args.dir)), since, until, args.camera)
+    if args.json:
+        for s in summaries:
+            if s['history_truncated']:
+                print(f"Warning: the journal for {s['camera']} starts at "
+                      f"{datetime.fromtimestamp(s['history_start']).strftime('%Y-%m-%d %H:%M')}, after the "
+                      f"window start; older history was rotated away or never recorded "
+                      f"(retention: INCIDENT_MAX_SIZE_MB x INCIDENT_BACKUPS)", file=sys.stderr)
+        print(json.dumps({'since': since, 'until': until, 'cameras': summaries}, indent=2))
+    else:
+        print_report(summaries, since, until)
+
+if __name__ == '__main__':
+    main()
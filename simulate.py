@@ -0,0 +1,792 @@
+#!/usr/bin/env python3
+"""
+VantageCam Watchdog Simulator
+Replays outage scenarios against the real Watchdog recovery logic in virtual
+time, so detection and recovery can be measured - and threshold changes
+compared - in milliseconds instead of waiting out startup delays, backoffs and
+verification windows against a live YouTube.
+
+The Watchdog runs unmodified on an event loop whose clock only moves when every
+task is waiting: a 180s startup delay or a 15 minute backoff is one step. Its
+collaborators are fakes driven by one simulated world:
+
+  camera      RTSP answers unless a scenario takes it down
+  FFmpeg      runs, exits when the camera goes away, stalls (ingest drop) or
+              can't reach YouTube at all (ingest outage);
+              a stopped encoder is relaunched by a fake start.sh loop, which
+              also switches to and from the BRB fallback like the real one
+  YouTube     goes live LIVE_LAG seconds after data starts flowing and offline
+              OFFLINE_LAG seconds after it stops; the status endpoint can
+              return errors (5xx) or fail on an expired OAuth token
+
+For every fault the report gives time to detect (fault -> watchdog 'detect')
+and time to recover (fault -> camera feed live on YouTube again), plus the
+restarts, needless restarts, downtime, time on the BRB screen and alerts.
+Each scenario has an expected outcome (all faults detected, no needless
+restarts, recovery within a bound...); the exit code is 1 if any run misses it.
+--checks runs assert-based unit checks of the watchdog's building blocks instead.
+
+Usage:
+  python3 /simulate.py                                  # every scenario
+  python3 /simulate.py camera_flap ingest_drop --json
+  python3 /simulate.py --set INITIAL_DELAY=5,10 --set STABILITY_THRESHOLD=20,30
+  python3 /simulate.py --checks
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import itertools
+import selectors
+import tempfile
+import logging
+import threading
+import traceback
+import http.server
+
+import rtsp_probe
+
+EPOCH = 1_750_000_000   # Virtual time 0 as a wall-clock time (quota day, log timestamps)
+
+LIVE_LAG = 10           # YouTube shows the stream live this long after data starts flowing
+OFFLINE_LAG = 15        # ... and offline this long after it stops
+RELAUNCH_DELAY = 3      # start.sh loop: a stopped FFmpeg is running again after this long
+FALLBACK_RECHECK = 10   # start.sh pings the camera this often while on the BRB screen
+
+
+# ==============================================================================
+#  VIRTUAL CLOCK
+# ==============================================================================
+
+class _VirtualSelector:
+    """Wraps the loop's selector: never blocks, jumps the clock to the next timer instead"""
+
+    def __init__(self, selector, loop):
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if not events:
+            if timeout is None:
+                raise RuntimeError("Simulation deadlocked: every task is waiting and no timer is scheduled")
+            self._loop.now += timeout
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop whose time() is virtual: sleeps and timeouts complete instantly, in order"""
+
+    def __init__(self):
+        super().__init__(selectors.DefaultSelector())
+        self.now = 0.0
+        self._selector = _VirtualSelector(self._selector, self)
+
+    def time(self):
+        return self.now
+
+
+async def inline(func, *args):
+    """Watchdog offload for the simulation: fakes never block, so no threads (which run in real time)"""
+    return func(*args)
+
+
+# ==============================================================================
+#  SIMULATED WORLD
+# ==============================================================================
+
+class World:
+    """Camera, FFmpeg, start.sh and YouTube as seen through the watchdog's collaborators"""
+
+    def __init__(self, clock, stall_grace=3):
+        self.clock = clock
+        self.stall_grace = stall_grace     # A stalled encoder is flagged after this long (WATCHDOG_LOCAL_GRACE)
+        self.camera_up = True
+        self.api_errors = False
+        self.token_expired = False
+        self.ingest_down = False           # YouTube ingest unreachable: no restart can help
+
+        self.ffmpeg_running = True
+        self.stalled_since = None      # Ingest dropped: FFmpeg runs but nothing reaches YouTube
+        self.fallback = False
+        self.relaunch_at = None
+        self.next_camera_ping = 0
+
+        self.flowing_since = 0.0
+        self.stopped_since = None
+        self.youtube = 'live'
+
+        self.needless_restarts = 0
+        self.alerts = []
+        self.healthy_log = [(0.0, True)]   # Transitions of "camera feed live on YouTube"
+        self.youtube_log = [(0.0, True)]   # Transitions of "YouTube shows live" (BRB counts)
+        self.fallback_time = 0.0
+
+    def flowing(self):
+        return self.ffmpeg_running and self.stalled_since is None and not self.ingest_down
+
+    def update(self):
+        """Bring flow bookkeeping and YouTube's view up to now (called on every state change and tick)"""
+        now = self.clock()
+        if self.flowing():
+            self.stopped_since = None
+            if self.flowing_since is None:
+                self.flowing_since = now
+            if now - self.flowing_since >= LIVE_LAG:
+                self.youtube = 'live'
+        else:
+            self.flowing_since = None
+            if self.stopped_since is None:
+                self.stopped_since = now
+            if now - self.stopped_since >= OFFLINE_LAG:
+                self.youtube = 'offline'
+        self._log(self.youtube_log, self.youtube == 'live')
+        self._log(self.healthy_log, self.youtube == 'live' and not self.fallback and self.flowing())
+
+    def _log(self, log, value):
+        if log[-1][1] != value:
+            log.append((self.clock(), value))
+
+    def start_ffmpeg(self):
+        self.ffmpeg_running = True
+        self.stalled_since = None
+        self.relaunch_at = None
+        self.fallback = not self.camera_up
+        self.next_camera_ping = self.clock() + FALLBACK_RECHECK
+
+    def ffmpeg_exit(self):
+        self.ffmpeg_running = False
+        self.stalled_since = None
+        self.relaunch_at = self.clock() + RELAUNCH_DELAY
+
+    async def start_sh(self):
+        """The supervisor loop: relaunch FFmpeg, fall back to BRB without a camera, switch back"""
+        while True:
+            now = self.clock()
+            if self.ffmpeg_running and not self.fallback and not self.camera_up:
+                self.ffmpeg_exit()              # Lost its RTSP input
+            elif self.fallback and now >= self.next_camera_ping:
+                self.next_camera_ping = now + FALLBACK_RECHECK
+                if self.camera_up:
+                    self.ffmpeg_exit()          # Kill BRB, relaunch on the camera
+            if not self.ffmpeg_running and now >= self.relaunch_at:
+                self.start_ffmpeg()
+            if self.fallback:
+                self.fallback_time += 1
+            self.update()
+            await asyncio.sleep(1)
+
+    # --------------------------------------------------------------------------
+    #  Watchdog collaborators
+    # --------------------------------------------------------------------------
+
+    def check_status(self, fresh=False):
+        self.update()
+        if self.api_errors or self.token_expired:
+            return 'error', None
+        return self.youtube, None if self.youtube == 'live' else 'ingest_not_receiving'
+
+    def check_rtsp(self):
+        return 'healthy' if self.camera_up else 'unreachable'
+
+    def check_encoder(self):
+        if not self.ffmpeg_running:
+            return 'ffmpeg_exited'
+        if self.stalled_since is not None and self.clock() - self.stalled_since >= self.stall_grace:
+            return 'bitrate_zero'
+        if self.ingest_down:
+            return 'rtmp_closed'
+        return None
+
+    def stop_ffmpeg(self):
+        if self.youtube == 'live' and self.flowing() and not self.fallback:
+            self.needless_restarts += 1
+        if self.ffmpeg_running:
+            self.ffmpeg_exit()
+        self.update()
+
+    def ensure_public(self):
+        if self.token_expired:
+            raise RuntimeError("OAuth token expired")
+
+    def is_fallback(self):
+        return self.fallback
+
+    def alert(self, error_type, details):
+        self.alerts.append((self.clock(), error_type))
+
+    # --------------------------------------------------------------------------
+    #  Faults
+    # --------------------------------------------------------------------------
+
+    async def camera_down(self, duration):
+        self.camera_up = False
+        await asyncio.sleep(duration)
+        self.camera_up = True
+
+    async def ingest_drop(self, duration=None):
+        if self.ffmpeg_running and not self.fallback:
+            self.stalled_since = self.clock()
+            self.update()
+
+    async def encoder_crash(self, duration=None):
+        if self.ffmpeg_running:
+            self.ffmpeg_exit()
+            self.update()
+
+    async def ingest_outage(self, duration):
+        self.ingest_down = True
+        self.update()
+        await asyncio.sleep(duration)
+        self.ingest_down = False
+
+    async def api_5xx(self, duration):
+        self.api_errors = True
+        await asyncio.sleep(duration)
+        self.api_errors = False
+
+    async def token_expiry(self, duration=None):
+        self.token_expired = True
+        if duration:
+            await asyncio.sleep(duration)
+            self.token_expired = False
+
+
+class Journal:
+    """IncidentJournal stand-in keeping events in memory with virtual timestamps"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.events = []
+
+    def record(self, event, **fields):
+        self.events.append((self.clock(), event, fields))
+
+
+# ==============================================================================
+#  SCENARIOS
+# ==============================================================================
+
+# name: (description, [(at, fault, duration)], simulated seconds, expected outcome)
+# Expected outcome: min_<result> / max_<result> bounds on the summarize() values; a run that
+# misses one is reported as FAIL and makes simulate.py exit non-zero.
+RECOVERED = {'max_unrecovered': 0, 'max_needless_restarts': 0}
+SCENARIOS = {
+    'camera_flap': ("Camera drops out for 20s every minute, five times",
+                    [(600 + i * 60, 'camera_down', 20) for i in range(5)], 1800,
+                    dict(RECOVERED, min_detected=5, max_ttd_max=10, max_ttr_max=60, max_offline_seconds=0)),
+    'camera_outage': ("Camera unreachable for 5 minutes", [(600, 'camera_down', 300)], 1800,
+                      dict(RECOVERED, min_detected=1, max_ttd_max=10, max_ttr_max=360, max_offline_seconds=0)),
+    'ingest_drop': ("FFmpeg keeps running but its RTMP output stalls", [(600, 'ingest_drop', None)], 1800,
+                    dict(RECOVERED, min_detected=1, max_ttd_max=10, max_ttr_max=60, max_offline_seconds=30)),
+    'encoder_crash': ("FFmpeg exits; start.sh relaunches it", [(600, 'encoder_crash', None)], 1800,
+                      dict(RECOVERED, min_detected=1, max_ttd_max=10, max_ttr_max=30, max_offline_seconds=30)),
+    'ingest_outage': ("YouTube ingest unreachable for 4 minutes - restarts can't help until it is back",
+                      [(600, 'ingest_outage', 240)], 1800,
+                      dict(RECOVERED, min_detected=1, max_ttr_max=300, max_offline_seconds=300)),
+    'api_5xx': ("Status endpoint returns errors for 10 minutes (stream fine)", [(600, 'api_5xx', 600)], 1800,
+                {'max_restarts': 0, 'max_offline_seconds': 0, 'max_off_camera_seconds': 0}),
+    'token_expiry': ("OAuth token expires, then the ingest drops while YouTube is blind",
+                     [(600, 'token_expiry', None), (900, 'ingest_drop', None)], 1800,
+                     dict(RECOVERED, min_detected=1, max_restarts=1, max_ttr_max=60)),
+}
+
+
+def unmet(result, expect):
+    """The expected-outcome bounds a scenario result misses, as readable strings"""
+    missed = []
+    for bound, limit in expect.items():
+        kind, _, name = bound.partition('_')
+        value = result[name]
+        if value is None:
+            if kind == 'min':
+                missed.append(f"{name} missing (>= {limit} expected)")
+        elif kind == 'min' and value < limit:
+            missed.append(f"{name} {value:g} < {limit}")
+        elif kind == 'max' and value > limit:
+            missed.append(f"{name} {value:g} > {limit}")
+    return missed
+
+
+def first_after(log, start, value=True):
+    """First time >= start at which the transition log holds value, or None"""
+    state = None
+    for t, v in log:
+        if t > start:
+            if state == value:
+                return start
+            if v == value:
+                return t
+        state = v
+    return start if state == value else None
+
+
+def time_false(log, end):
+    """Seconds the transition log spent False up to end"""
+    total = 0.0
+    for (t, v), (t_next, _) in zip(log, log[1:] + [(end, None)]):
+        if not v:
+            total += min(t_next, end) - t
+    return total
+
+
+async def run_scenario(watchdog_module, faults, duration):
+    wd = watchdog_module
+    loop = asyncio.get_running_loop()
+    world = World(loop.time, stall_grace=wd.LOCAL_GRACE)
+    journal = Journal(loop.time)
+    quota = wd.QuotaScheduler(budget=wd.QUOTA_BUDGET, base_interval=wd.CHECK_INTERVAL,
+                              max_interval=wd.MAX_CHECK_INTERVAL, clock=lambda: EPOCH + loop.time())
+    watchdog = wd.Watchdog(
+        state=wd.WatchdogState(os.path.join(wd.RUN_DIR, f"sim_state_{id(world)}.json")),
+        check_status=world.check_status, check_progress=lambda: True, check_rtsp=world.check_rtsp,
+        stop_ffmpeg=world.stop_ffmpeg, ensure_public=world.ensure_public, alert=world.alert,
+        is_fallback=world.is_fallback, quota=quota, check_encoder=world.check_encoder,
+        clock=loop.time, metrics=wd.Metrics("simulate", root=wd.RUN_DIR), journal=journal,
+        encoder_fd=lambda: None, offload=inline, report_status=lambda *a: None, startup_checks=())
+
+    async def inject(at, fault, length):
+        await asyncio.sleep(at)
+        await getattr(world, fault)(length)
+
+    tasks = [asyncio.create_task(watchdog.run()), asyncio.create_task(world.start_sh())]
+    tasks += [asyncio.create_task(inject(*f)) for f in faults]
+    await asyncio.sleep(duration)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return world, journal
+
+
+def summarize(world, journal, faults, duration):
+    detects = [t for t, event, _ in journal.events if event == 'detect']
+    starts = [at for at, _, _ in faults]
+    ttd, ttr, unrecovered = [], [], 0
+    for i, at in enumerate(starts):
+        until = starts[i + 1] if i + 1 < len(starts) else duration
+        detected = next((t for t in detects if at <= t < until), None)
+        if detected is not None:
+            ttd.append(detected - at)
+        # Only faults that took the camera feed off air have a recovery time
+        off = first_after(world.healthy_log, at, False)
+        if off is not None and off < until:
+            back = first_after(world.healthy_log, off, True)
+            if back is not None:
+                ttr.append(back - at)
+            else:
+                unrecovered += 1
+
+    def stat(values, fn):
+        return round(fn(values), 1) if values else None
+
+    alerts = {}
+    for _, kind in world.alerts:
+        alerts[kind] = alerts.get(kind, 0) + 1
+    return {
+        'faults': len(faults),
+        'detected': len(ttd),
+        'ttd_mean': stat(ttd, lambda v: sum(v) / len(v)),
+        'ttd_max': stat(ttd, max),
+        'ttr_mean': stat(ttr, lambda v: sum(v) / len(v)),
+        'ttr_max': stat(ttr, max),
+        'unrecovered': unrecovered,
+        'restarts': sum(1 for _, event, _ in journal.events if event == 'restart'),
+        'needless_restarts': world.needless_restarts,
+        'offline_seconds': round(time_false(world.youtube_log, duration)),
+        'off_camera_seconds': round(time_false(world.healthy_log, duration)),
+        'fallback_seconds': round(world.fallback_time),
+        'alerts': alerts,
+    }
+
+
+# ==============================================================================
+#  UNIT CHECKS (--checks)
+# ==============================================================================
+# Assert-based checks for the building blocks the watchdog is assembled from.
+# Each gets a fresh directory and the imported watchdog module (for its classes).
+
+class _NoJitter:
+    @staticmethod
+    def uniform(low, high):
+        return 0
+
+
+def check_backoff(wd, tmp):
+    history = wd.IncidentHistory()
+    policy = wd.BackoffPolicy(history, initial=10, maximum=900, mode='adaptive', rng=_NoJitter())
+    assert policy.delay('camera', 1) == (30, "camera: default"), policy.delay('camera', 1)
+    assert policy.delay('encoder', 2)[0] == 20, "no history: doubles beyond the first attempt"
+
+    for relaunch in (8, 12, 20):
+        history.add({'cause': 'ffmpeg_exited', 'via': 'restart', 'attempts': 2, 'duration': 30,
+                     'phases': {'relaunch': relaunch}})
+    history.add({'cause': 'ffmpeg_exited', 'via': 'recovered', 'attempts': 0, 'duration': 5})
+    delay, reason = policy.delay('encoder', 2)
+    assert delay == 18, (delay, reason)                   # p75 of 8/12/20 = 12, * MARGIN
+    assert policy.delay('encoder', 3)[0] == 36, "doubles only past the usual two attempts"
+    assert policy.delay('ingest', 1)[0] == 20, "other classes keep their defaults"
+
+    capped = wd.BackoffPolicy(history, initial=10, maximum=25, mode='adaptive', rng=_NoJitter())
+    assert capped.delay('encoder', 5)[0] == 25
+    exponential = wd.BackoffPolicy(history, initial=10, maximum=900, mode='exponential', rng=_NoJitter())
+    assert exponential.delay('camera', 2) == (40, "exponential")
+
+
+def check_quota(wd, tmp):
+    now = [EPOCH]
+    clock = lambda: now[0]
+    quota = wd.QuotaScheduler(budget=10000, reserve=100, fast_interval=5, base_interval=30,
+                              max_interval=300, stable_after=600, clock=clock)
+    assert quota.next_interval('suspect', 0, 1) == 5
+    assert quota.next_interval('normal', 0, 1) == 30
+    assert quota.next_interval('normal', 1200, 1) == 120, "doubles per stable_after live"
+    assert quota.next_interval('normal', 10 ** 6, 1) == 300
+    assert quota.next_interval('normal', 0, 0) == 30, "free polls are never budget-limited"
+
+    quota.charge('list', 9850)
+    assert quota.can_spend('list') and quota.can_spend('update')
+    quota.charge('list', 60)
+    assert not quota.can_spend('list'), "lists may not touch the update reserve"
+    assert quota.can_spend('update')
+    assert quota.next_interval('normal', 0, 1) == quota.seconds_until_reset()
+    assert quota.next_interval('suspect', 0, 1) == quota.seconds_until_reset()
+    assert quota.snapshot()['calls'] == {'list': 2}
+
+    now[0] += 86400
+    assert quota.spent() == 0, "counters reset with the Pacific day"
+
+    path = os.path.join(tmp, "quota.json")
+    first = wd.QuotaScheduler(budget=100, path=path, clock=clock)
+    second = wd.QuotaScheduler(budget=100, path=path, clock=clock)
+    first.charge('update')
+    second.charge('list')
+    assert first.spent() == second.spent() == 51, "every camera spends from the shared file"
+
+
+def check_progress_tail(wd, tmp):
+    path = os.path.join(tmp, "progress.txt")
+    tail = wd.ProgressTail(path)
+    assert tail.poll() == (None, None), "missing file"
+
+    with open(path, 'w') as f:
+        f.write("frame=1\nspeed=1.0x\nprogress=continue\nframe=2\nspe")
+    block, mtime = tail.poll()
+    assert block['frame'] == '1' and mtime, block
+    with open(path, 'a') as f:
+        f.write("ed=0.5x\nprogress=continue\n")
+    assert tail.poll()[0] == {'frame': '2', 'speed': '0.5x', 'progress': 'continue'}, "partial line joined"
+
+    with open(path, 'a') as f:
+        f.write("".join(f"frame={i}\nprogress=continue\n" for i in range(3, 20000)))
+    assert tail.poll()[0]['frame'] == '19999', "jumps to the tail of a large append"
+    assert tail.offset == os.path.getsize(path)
+
+    os.remove(path)
+    with open(path, 'w') as f:
+        f.write("frame=7\nprogress=continue\n")
+    assert tail.poll()[0]['frame'] == '7', "recreated file is read from the start"
+    with open(path, 'w') as f:
+        f.write("frame=8\n")
+    assert tail.poll()[0] is None, "truncated file: no block until the next progress line"
+
+
+def check_state_store(wd, tmp):
+    path = os.path.join(tmp, "state.json")
+    store = wd.StateStore(path, delay=60)
+    assert store.load() == {}
+    store.save({'attempt': 1})
+    store.save({'attempt': 2})
+    assert not os.path.exists(path), "saves are coalesced until the delay or a flush"
+    store.flush()
+    assert store.load() == {'attempt': 2}
+    assert not os.path.exists(f"{path}.tmp")
+
+    with open(path, 'w') as f:
+        f.write("{truncated")
+    assert store.load() == {} and os.path.exists(f"{path}.bad"), "corrupt state is set aside"
+
+    history = wd.IncidentHistory(maxlen=2, incidents=[
+        {'cause': 'rtmp_closed', 'duration': 10, 'attempts': 1}, "junk", {'no': 'cause'}])
+    assert len(history) == 1
+    history.add({'cause': 'ffmpeg_exited', 'duration': 20, 'attempts': 2})
+    history.add({'cause': 'ffmpeg_exited', 'duration': 40, 'attempts': 3})
+    assert len(history) == 2 and history.last['duration'] == 40
+    assert history.cause_count('rtmp_closed') == 0 and history.cause_count('ffmpeg_exited') == 2
+    assert history.mean_duration() == 30 and history.mean_attempts() == 2.5
+
+
+class _Webhook(http.server.ThreadingHTTPServer):
+    """Local Discord stand-in: records every posted embed title"""
+    daemon_threads = True
+
+    def __init__(self):
+        self.titles = []
+        super().__init__(('127.0.0.1', 0), _WebhookHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/webhook"
+
+
+class _WebhookHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.titles.append(payload['embeds'][0]['title'])
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def check_notifier(wd, tmp):
+    webhook = _Webhook()
+    now = [EPOCH]
+    try:
+        spool = os.path.join(tmp, "spool.json")
+        notifier = wd.Notifier(webhook.url, spool_path=spool, coalesce_window=120, clock=lambda: now[0])
+        for title in ("Stream offline", "Stream recovered", "Stream offline"):
+            notifier.send(title, "details", group='stream')
+            now[0] += 10
+        notifier.send("Camera down", "details")
+        assert notifier.flush(5), "queue drained"
+        assert webhook.titles == ["Stream offline", "Camera down", "Stream offline (+1 more)"], webhook.titles
+        assert not os.path.exists(spool), "spool removed once everything is sent"
+
+        # Undeliverable alerts stay in the spool and go out from the next run
+        webhook.titles.clear()
+        down = wd.Notifier(f"http://127.0.0.1:{rtsp_probe.free_port()}/webhook", spool_path=spool,
+                           clock=lambda: now[0])
+        down.RETRY_DELAYS = (60,)
+        down.send("Credentials rejected", "details")
+        deadline = time.monotonic() + 5
+        while (down._sending or not down._queue) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with open(spool) as f:
+            assert [a['title'] for a in json.load(f)] == ["Credentials rejected"]
+        resent = wd.Notifier(webhook.url, spool_path=spool, clock=lambda: now[0])
+        assert resent.flush(5) and webhook.titles == ["Credentials rejected"], webhook.titles
+        assert not os.path.exists(spool)
+    finally:
+        webhook.shutdown()
+        webhook.server_close()
+
+
+def check_metrics(wd, tmp):
+    import metrics
+    now = [EPOCH]
+    for _ in range(2):      # Two processes sharing a source add up
+        m = wd.Metrics("check", labels={'camera': 'cam"1'}, root=tmp, clock=lambda: now[0])
+        m.inc('vantagecam_restarts_total', cause='rtmp_closed')
+        m.observe('vantagecam_api_latency_seconds', 0.3, api='camera_rtsp')
+        m.set('vantagecam_youtube_live', 1)
+        m.flush()
+
+    lines = metrics.render(tmp, now=now[0]).splitlines()
+    for expected in ('# TYPE vantagecam_restarts_total counter',
+                     'vantagecam_restarts_total{camera="cam\\"1",cause="rtmp_closed"} 2',
+                     'vantagecam_api_latency_seconds_bucket{api="camera_rtsp",camera="cam\\"1",le="0.25"} 0',
+                     'vantagecam_api_latency_seconds_bucket{api="camera_rtsp",camera="cam\\"1",le="0.5"} 2',
+                     'vantagecam_api_latency_seconds_bucket{api="camera_rtsp",camera="cam\\"1",le="+Inf"} 2',
+                     'vantagecam_api_latency_seconds_sum{api="camera_rtsp",camera="cam\\"1"} 0.6',
+                     'vantagecam_api_latency_seconds_count{api="camera_rtsp",camera="cam\\"1"} 2',
+                     'vantagecam_youtube_live{camera="cam\\"1"} 1'):
+        assert expected in lines, f"missing: {expected}"
+
+    stale = metrics.render(tmp, now=now[0] + metrics.GAUGE_STALE_AFTER + 1)
+    assert 'vantagecam_youtube_live' not in stale, "gauges of a silent source are dropped"
+    assert 'vantagecam_restarts_total{' in stale, "counters outlive their source"
+
+
+class _Subscriber:
+    """Collects what the control plane writes to one connection"""
+    class transport:
+        @staticmethod
+        def get_write_buffer_size():
+            return 0
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        pass
+
+    def events(self):
+        return [json.loads(line) for line in self.data.splitlines()]
+
+
+def check_control_plane(wd, tmp):
+    import control_plane
+    os.makedirs(os.path.join(tmp, "cameras", "cam1"))
+    plane = control_plane.ControlPlane(run_dir=tmp)
+    handle = plane.handle_request
+    sub = _Subscriber()
+
+    assert handle({'op': 'get', 'key': 'audio_mode'}, None) == {'ok': True, 'key': 'audio_mode', 'value': 'muted'}
+    assert handle({'op': 'subscribe', 'keys': 'stream_mode'}, sub)['ok'] is False, "keys must be a list"
+    assert handle({'op': 'subscribe', 'keys': ['stream_mode']}, sub) is None
+    assert sub.events() == [{'ok': True}, {'event': 'state', 'key': 'stream_mode', 'value': 'normal'}], sub.events()
+
+    assert handle({'op': 'set', 'key': 'stream_mode/cam1', 'value': 'fallback'}, None) == {'ok': True, 'changed': True}
+    assert handle({'op': 'set', 'key': 'stream_mode/cam1', 'value': 'fallback'}, None) == {'ok': True, 'changed': False}
+    assert handle({'op': 'set', 'key': 'audio_mode', 'value': 'music'}, None)['ok']
+    assert sub.events()[2:] == [{'event': 'state', 'key': 'stream_mode/cam1', 'value': 'fallback'}], \
+        "a prefix subscription gets per-camera changes only once, and nothing else"
+    with open(os.path.join(tmp, "cameras", "cam1", "stream_mode")) as f:
+        assert f.read() == "fallback\n"
+
+    for bad in ({'op': 'set', 'key': 'audio_mode', 'value': 'loud'},
+                {'op': 'set', 'key': 'audio_mode/cam1', 'value': 'music'},
+                {'op': 'set', 'key': 'stream_mode/../x', 'value': 'normal'},
+                {'op': 'set', 'key': 'weather', 'value': 'on'},
+                {'op': 'publish', 'key': 'audio_mode'},
+                {'op': 'get', 'key': 'nope'},
+                {'op': 'drop', 'key': 'audio_mode'}):
+        assert handle(bad, None)['ok'] is False, bad
+    assert handle({'op': 'publish', 'key': 'overlay/weather'}, None) == {'ok': True}
+
+    reloaded = control_plane.ControlPlane(run_dir=tmp)
+    assert reloaded.values == {'audio_mode': 'music', 'stream_mode/cam1': 'fallback'}, reloaded.values
+
+
+CHECKS = [check_backoff, check_quota, check_progress_tail, check_state_store, check_notifier,
+          check_metrics, check_control_plane]
+
+
+def run_checks(wd, work_dir):
+    """Runs every unit check; prints one line each and returns True if all passed"""
+    failed = 0
+    for check in CHECKS:
+        name = check.__name__[len('check_'):]
+        try:
+            check(wd, tempfile.mkdtemp(prefix=f"{name}-", dir=work_dir))
+            print(f"ok   {name}")
+        except Exception as e:
+            failed += 1
+            frame = traceback.extract_tb(e.__traceback__)[-1]
+            print(f"FAIL {name} ({os.path.basename(frame.filename)}:{frame.lineno}): {e!r}")
+    print(f"{len(CHECKS) - failed}/{len(CHECKS)} passed")
+    return failed == 0
+
+
+# ==============================================================================
+#  MAIN
+# ==============================================================================
+
+def parse_overrides(values, module):
+    """--set NAME=v1,v2 -> {NAME: [v1, v2]} converted to the type of the watchdog constant"""
+    overrides = {}
+    for item in values:
+        name, _, raw = item.partition('=')
+        if not hasattr(module, name):
+            raise SystemExit(f"Unknown watchdog setting: {name}")
+        kind = type(getattr(module, name))
+        convert = (lambda v: v.lower() == 'true') if kind is bool else kind
+        overrides[name] = [convert(v.strip()) for v in raw.split(',') if v.strip()]
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay outage scenarios against the watchdog in virtual time")
+    parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default all): {', '.join(SCENARIOS)}")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=V1,V2',
+                        help="Override a watchdog constant (e.g. INITIAL_DELAY=5,10); lists run as a matrix")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed for backoff jitter (default 1)")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('--verbose', action='store_true', help="Show the watchdog's log (virtual timestamps)")
+    parser.add_argument('--checks', action='store_true',
+                        help="Run the unit checks (backoff, quota, progress tail, state, alerts, metrics, control plane)")
+    args = parser.parse_args()
+
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    # Keep the watchdog's files, metrics and alerts away from the real ones before it is imported
+    work_dir = tempfile.mkdtemp(prefix="vantagecam-sim-")
+    os.environ.update(VANTAGECAM_RUN_DIR=work_dir, HEALTH_DIR=work_dir, METRICS_DIR=work_dir,
+                      WATCHDOG_STATUS_URL="http://simulated/status", RTSP_SOURCE="rtsp://simulated/stream")
+    for name in ("DISCORD_WEBHOOK_URL", "YOUTUBE_CLIENT_ID", "YOUTUBE_CLIENT_SECRET", "YOUTUBE_REFRESH_TOKEN"):
+        os.environ.pop(name, None)
+    import watchdog
+
+    loop = VirtualClockLoop()
+    asyncio.set_event_loop(loop)
+    watchdog.setup_logging('Watchdog')   # stdout only - importing the watchdog configures no logging
+
+    def virtual_time(record):
+        record.created = EPOCH + loop.time()
+        return True
+    root = logging.getLogger()
+    for handler in root.handlers:
+        handler.addFilter(virtual_time)
+    if not args.verbose:
+        root.setLevel(logging.ERROR)
+
+    if args.checks:
+        try:
+            passed = run_checks(watchdog, work_dir)
+        finally:
+            loop.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+        sys.exit(0 if passed else 1)
+
+    overrides = parse_overrides(args.set, watchdog)
+    names = list(overrides)
+    results = []
+    try:
+        for combo in itertools.product(*overrides.values()):
+            settings = dict(zip(names, combo))
+            for name, value in settings.items():
+                setattr(watchdog, name, value)
+            for scenario in args.scenarios or SCENARIOS:
+                description, faults, duration, expect = SCENARIOS[scenario]
+                random.seed(args.seed)
+                loop.now = 0.0
+                world, journal = loop.run_until_complete(run_scenario(watchdog, faults, duration))
+                result = summarize(world, journal, faults, duration)
+                results.append(dict({'scenario': scenario, 'settings': settings}, **result,
+                                    unmet=unmet(result, expect)))
+    finally:
+        loop.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    failed = [r for r in results if r['unmet']]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        sys.exit(1 if failed else 0)
+
+    def fmt(value):
+        return "-" if value is None else f"{value:g}"
+    labels = [" ".join(f"{k}={v}" for k, v in r['settings'].items()) or "defaults" for r in results]
+    width = max(len(label) for label in labels + ['settings'])
+    print(f"{'scenario':<14} {'settings':<{width}} {'det':>5} {'ttd avg/max':>12} {'ttr avg/max':>12} "
+          f"{'restarts':>8} {'needless':>8} {'offline':>7} {'fallback':>8} {'alerts':>6}")
+    for r, settings in zip(results, labels):
+        print(f"{r['scenario']:<14} {settings:<{width}} {r['detected']:>2}/{r['faults']:<2} "
+              f"{fmt(r['ttd_mean']) + '/' + fmt(r['ttd_max']):>12} {fmt(r['ttr_mean']) + '/' + fmt(r['ttr_max']):>12} "
+              f"{r['restarts']:>8} {r['needless_restarts']:>8} {r['offline_seconds']:>6}s {r['fallback_seconds']:>7}s "
+              f"{sum(r['alerts'].values()):>6}")
+    print(f"\nttd = fault to watchdog detection, ttr = fault to camera feed live again (seconds, virtual time). "
+          f"YouTube lags: live {LIVE_LAG}s, offline {OFFLINE_LAG}s.")
+    for r, settings in zip(results, labels):
+        if r['unmet']:
+            print(f"FAIL {r['scenario']} ({settings}): {'; '.join(r['unmet'])}")
+    print(f"{len(results) - len(failed)}/{len(results)} scenarios met their expected outcome")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VantageCam state store
+Persistence for the watchdog's state file.
+
+- StateStore writes JSON to a temp file, fsyncs it and renames it over the old
+  one, so a crash mid-write leaves the previous state intact. Saves arriving
+  within `delay` seconds of each other are coalesced into one write.
+- IncidentHistory is a bounded ring buffer of recent outages (cause, duration,
+  restart attempts) with running totals, so "how often / how long lately" is
+  O(1) to read when deciding on backoff or alert wording.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import deque, Counter
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """Atomic, coalescing JSON file writer"""
+
+    def __init__(self, path, delay=1.0):
+        self.path = path
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._pending = None      # Latest data not yet written
+        self._timer = None
+
+    def load(self):
+        """The stored dict, or {} if there is none (a corrupt file is kept as .bad)"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return data
+            raise ValueError("not a JSON object")
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load state ({e}) - starting fresh")
+            try:
+                os.replace(self.path, f"{self.path}.bad")
+            except OSError:
+                pass
+            return {}
+
+    def save(self, data):
+        """Schedule data to be written; the last save within the delay wins"""
+        with self._lock:
+            self._pending = data
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write pending data now (called by the timer and at shutdown)"""
+        with self._lock:
+            data, self._pending = self._pending, None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if data is None:
+                return
+            try:
+                self._write(data)
+            except (OSError, TypeError, ValueError) as e:
+                logger.warning(f"Could not save state: {e}")
+
+    def _write(self, data):
+        directory = os.path.dirname(self.path) or '.'
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        # Make the rename itself durable
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+
+class IncidentHistory:
+    """Ring buffer of recent incidents: {'ended', 'cause', 'duration', 'attempts', 'via'}"""
+
+    def __init__(self, maxlen=50, incidents=()):
+        self.items = deque(maxlen=maxlen)
+        self.total_duration = 0.0
+        self.total_attempts = 0
+        self.causes = Counter()
+        for incident in incidents:
+            if isinstance(incident, dict) and 'cause' in incident:
+                self.add(incident)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, incident):
+        if len(self.items) == self.items.maxlen:
+            self._forget(self.items[0])
+        self.items.append(incident)
+        self.total_duration += incident.get('duration', 0)
+        self.total_attempts += incident.get('attempts', 0)
+        self.causes[incident['cause']] += 1
+
+    def _forget(self, incident):
+        self.total_duration -= incident.get('duration', 0)
+        self.total_attempts -= incident.get('attempts', 0)
+        self.causes[incident['cause']] -= 1
+
+    @property
+    def last(self):
+        return self.items[-1] if self.items else None
+
+    def mean_duration(self):
+        return self.total_duration / len(self.items) if self.items else 0.0
+
+    def mean_attempts(self):
+        return self.total_attempts / len(self.items) if self.items else 0.0
+
+    def cause_count(self, cause):
+        return self.causes.get(cause, 0)
+
+    def to_list(self):
+        return list(self.items)
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VantageCam status service
+In-container replacement for youtube_status.php. One process owns the OAuth
+token and the only YouTube status poller; the watchdog, yt-live-redirector.sh
+and the website all read from it instead of polling YouTube separately.
+
+- A background poller reads the broadcast and its stream health, paced by the
+  shared quota scheduler (fast around transitions, backing off while stable)
+- Concurrent reads are coalesced: whoever arrives while a fetch is in flight
+  waits for that fetch instead of starting another one
+- Live/offline transitions are pushed: long-poll (/status?wait=) and
+  Server-Sent Events (/events)
+- /status?fresh=1 answers from a read at most STATUS_FRESH_MAX_AGE seconds old
+  (older when the quota scheduler's pacing says the budget can't pay for that),
+  which the watchdog uses while verifying a recovery. Fresh reads spend quota,
+  so they are only honoured for loopback callers or with STATUS_API_KEY;
+  anyone else gets the cached read
+
+Endpoints (port STATUS_PORT, read-only, no API key):
+  GET /status                  {"status": "live|offline|error", "title", "viewers", ...}
+  GET /status?fresh=1          same, from a fresh read (loopback or X-API-Key only)
+  GET /status?wait=30&since=V  returns when the version differs from V (or after 30s)
+  GET /events                  text/event-stream, one "status" event per transition
+  GET /live                    302 to the live broadcast, or STATUS_FALLBACK_URL when offline
+  GET /youtube_status.php      alias of /status for existing clients
+  GET /health
+"""
+
+import os
+import hmac
+import json
+import time
+import ipaddress
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from youtube_api import YouTubeClient, QuotaScheduler
+from metrics import Metrics
+from log_setup import setup_logging
+
+# ==============================================================================
+#  CONFIGURATION (from environment variables)
+# ==============================================================================
+
+STATUS_PORT = int(os.getenv("STATUS_PORT", "9996"))
+STATUS_INTERVAL = int(os.getenv("STATUS_CHECK_INTERVAL", "30"))          # Normal poll interval
+STATUS_MAX_INTERVAL = int(os.getenv("STATUS_MAX_CHECK_INTERVAL", "300"))  # Backed-off interval while stable
+FRESH_MAX_AGE = float(os.getenv("STATUS_FRESH_MAX_AGE", "5"))             # ?fresh=1 accepts reads this old
+MAX_SUBSCRIBERS = int(os.getenv("STATUS_MAX_SUBSCRIBERS", "100"))         # Long-poll + SSE connections
+FALLBACK_URL = os.getenv("STATUS_FALLBACK_URL", "")                       # /live target while offline
+API_KEY = os.getenv("STATUS_API_KEY", "")                                 # X-API-Key allowing ?fresh=1 from outside
+
+YOUTUBE_CLIENT_ID = os.getenv("YOUTUBE_CLIENT_ID", "")
+YOUTUBE_CLIENT_SECRET = os.getenv("YOUTUBE_CLIENT_SECRET", "")
+YOUTUBE_REFRESH_TOKEN = os.getenv("YOUTUBE_REFRESH_TOKEN", "")
+QUOTA_BUDGET = int(os.getenv("YOUTUBE_QUOTA_BUDGET", "10000"))
+QUOTA_FILE = "/config/youtube_quota.json"  # Shared with the watchdogs - one Cloud project, one quota
+
+SUSPECT_WINDOW = 120      # Poll fast for this long after a transition or a fresh read
+STALE_AFTER = 600         # A failed read keeps the last good status this long (marked stale)
+MAX_WAIT = 60             # Longest long-poll a client may ask for
+KEEPALIVE_INTERVAL = 15   # SSE comment line so proxies don't drop idle streams
+UNITS_PER_POLL = 2        # liveBroadcasts.list + liveStreams.list
+METRICS_FLUSH_INTERVAL = 10
+
+logger = logging.getLogger("status_service")
+
+
+# ==============================================================================
+#  POLLER
+# ==============================================================================
+
+class StatusPoller:
+    """
+    Holds the current status and the only path to YouTube. refresh(max_age)
+    returns a status at most max_age seconds old, fetching at most once no
+    matter how many threads ask at the same time. The version goes up on every
+    transition (status, cause or broadcast changed), which is what long-poll and
+    SSE clients wait on.
+    """
+
+    def __init__(self, client, quota, metrics=None, clock=time.monotonic, wall=time.time):
+        self.client = client
+        self.quota = quota
+        self.metrics = metrics
+        self.clock = clock
+        self.wall = wall
+
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self.running = False
+        self.fetching = False
+        self.checked = None          # clock() when the last fetch finished
+        self.changed = clock()       # clock() of the last transition
+        self.urgent_until = 0        # Poll fast until then
+        self.last_good = None        # clock() of the last successful read
+        self.version = 0
+        self.current = {'status': 'unknown', 'version': 0}
+
+    # --------------------------------------------------------------------------
+    #  Reading
+    # --------------------------------------------------------------------------
+
+    def fetch(self):
+        """One read from the API: (status, cause, broadcast)"""
+        status, cause = self.client.get_live_status()
+        return status, cause, self.client.broadcast if status == 'live' else None
+
+    def refresh(self, max_age):
+        """The status, fetched now unless a read at most max_age seconds old exists (or is in flight)"""
+        with self._cond:
+            joined = False
+            while self.fetching:
+                joined = True
+                self._cond.wait()
+            if joined or (self.checked is not None and self.clock() - self.checked <= max_age):
+                self._count('joined' if joined else 'cached')
+                return self.current
+            self.fetching = True
+
+        result = ('error', None, None)
+        try:
+            result = self.fetch()
+        except Exception as e:
+            logger.error(f"Status read failed: {e}")
+        finally:
+            with self._cond:
+                self.fetching = False
+                self._apply(*result)
+                self._cond.notify_all()
+        self._count('fetched')
+        return self.current
+
+    def wait_change(self, since, timeout):
+        """Block until the version differs from since (or timeout passes); returns the status"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != since or not self.running, timeout)
+            return self.current
+
+    def fresh_max_age(self):
+        """
+        How old a ?fresh=1 answer may be. Fresh reads go through the same quota
+        pacing as the fast polls: normally STATUS_FRESH_MAX_AGE, but never newer
+        than the interval the remaining daily budget can pay for.
+        """
+        return max(FRESH_MAX_AGE, self.quota.next_interval('suspect', 0, UNITS_PER_POLL))
+
+    def hurry(self):
+        """Someone is watching closely (a recovery is being verified) - poll fast for a while"""
+        self.urgent_until = self.clock() + SUSPECT_WINDOW
+        self._wake.set()
+
+    def _count(self, result):
+        if self.metrics:
+            self.metrics.inc('vantagecam_status_reads_total', result=result)
+
+    def _apply(self, status, cause, broadcast):
+        """Turn a read into the published status (called with the lock held)"""
+        now = self.clock()
+        self.checked = now
+        if status == 'error':
+            if self.last_good is not None and now - self.last_good < STALE_AFTER:
+                # Keep the last known state rather than flapping every client to "error"
+                self.current = dict(self.current, stale=True, checked=round(self.wall()))
+                return
+        else:
+            self.last_good = now
+
+        broadcast = broadcast or {}
+        previous = self.current
+        new = {
+            'status': status,
+            'cause': cause,
+            'title': broadcast.get('title'),
+            'viewers': broadcast.get('viewers', 0),
+            'started': broadcast.get('started'),
+            'thumbnail': broadcast.get('thumbnail'),
+            'broadcast_id': broadcast.get('id'),
+            'checked': round(self.wall()),
+            'since': previous.get('since'),
+            'version': self.version,
+        }
+        if status == 'error':
+            new['message'] = 'YouTube API unavailable'
+        if (status, cause, new['broadcast_id']) != \
+                (previous['status'], previous.get('cause'), previous.get('broadcast_id')):
+            self.version += 1
+            self.changed = now
+            self.urgent_until = now + SUSPECT_WINDOW
+            new.update(version=self.version, since=new['checked'])
+            if status == 'live':
+                logger.info(f"Stream is LIVE: '{new['title']}' ({new['broadcast_id']})")
+            elif status == 'offline':
+                logger.info(f"Stream is OFFLINE ({cause})")
+            else:
+                logger.warning("YouTube status unavailable")
+        self.current = new
+
+    # --------------------------------------------------------------------------
+    #  Background polling
+    # --------------------------------------------------------------------------
+
+    def interval(self):
+        mode = 'suspect' if self.clock() < self.urgent_until else 'normal'
+        return self.quota.next_interval(mode, self.clock() - self.changed, UNITS_PER_POLL)
+
+    def run(self):
+        """Poll loop (own thread). Reads done for clients count - the next poll is due interval after them."""
+        while self.running:
+            with self._cond:
+                age = float('inf') if self.checked is None else self.clock() - self.checked
+            interval = self.interval()
+            if age >= interval:
+                try:
+                    self.refresh(0)
+                except Exception as e:
+                    logger.error(f"Status poller error: {e}")
+                continue
+            self._wake.clear()
+            self._wake.wait(interval - age)
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.run, name="poller", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        with self._cond:
+            self._cond.notify_all()
+
+
+# ==============================================================================
+#  HTTP
+# ==============================================================================
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """Routes for one request; the poller and subscriber slots live on the server"""
+
+    def log_message(self, format, *args):
+        pass  # Suppress default logging
+
+    @property
+    def poller(self):
+        return self.server.poller
+
+    def send_json(self, data, status=200, cache='no-cache'):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', cache)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path in ('/status', '/youtube_status.php'):
+                self.get_status(query)
+            elif url.path == '/events':
+                self.get_events()
+            elif url.path == '/live':
+                self.get_live()
+            elif url.path == '/health':
+                self.send_json({'status': 'ok', 'youtube': self.poller.current['status'],
+                                'subscribers': self.server.subscribers})
+            else:
+                self.send_json({'error': 'Not found'}, 404)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client went away
+
+    def may_read_fresh(self):
+        """Fresh reads cost quota the watchdogs share: loopback callers, or the API key if one is set"""
+        try:
+            if ipaddress.ip_address(self.client_address[0]).is_loopback:
+                return True
+        except ValueError:
+            pass
+        key = self.headers.get('X-API-Key', '')
+        return bool(API_KEY) and hmac.compare_digest(key.encode(), API_KEY.encode())
+
+    def normal_read(self):
+        # The poller keeps the status current; only fetch here if it has fallen behind
+        return self.poller.refresh(max(self.poller.interval(), STATUS_INTERVAL) * 2)
+
+    def get_status(self, query):
+        if 'wait' in query:
+            try:
+                since = int(query.get('since', -1))
+                wait = min(max(float(query['wait']), 0), MAX_WAIT)
+            except ValueError:
+                self.send_json({'error': 'wait and since must be numbers'}, 400)
+                return
+            with self.server.subscription() as ok:
+                if not ok:
+                    self.send_busy()
+                    return
+                self.send_json(self.poller.wait_change(since, wait))
+        elif query.get('fresh') in ('1', 'true') and self.may_read_fresh():
+            self.poller.hurry()
+            current = self.poller.refresh(self.poller.fresh_max_age())
+            if current.get('stale'):
+                # The caller asked for a fresh answer - a stale one is no answer
+                current = dict(current, status='error', message='YouTube API unavailable')
+            self.send_json(current, cache='no-store')
+        else:
+            self.send_json(self.normal_read(), cache=f'public, max-age={min(STATUS_INTERVAL, 30)}')
+
+    def get_events(self):
+        with self.server.subscription() as ok:
+            if not ok:
+                self.send_busy()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('X-Accel-Buffering', 'no')  # nginx: don't buffer the stream
+            self.end_headers()
+            self.wfile.write(b'retry: 5000\n\n')
+
+            current = self.normal_read()
+            while self.poller.running:
+                self.wfile.write(f"id: {current['version']}\nevent: status\n"
+                                 f"data: {json.dumps(current)}\n\n".encode())
+                self.wfile.flush()
+                version = current['version']
+                while self.poller.running:
+                    current = self.poller.wait_change(version, KEEPALIVE_INTERVAL)
+                    if current['version'] != version:
+                        break
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+
+    def get_live(self):
+        current = self.normal_read()
+        if current['status'] == 'live' and current.get('broadcast_id'):
+            target = f"https://www.youtube.com/watch?v={current['broadcast_id']}"
+        elif FALLBACK_URL:
+            target = FALLBACK_URL
+        else:
+            self.send_json({'status': current['status'], 'error': 'Not live and no STATUS_FALLBACK_URL set'}, 404)
+            return
+        self.send_response(302)
+        self.send_header('Location', target)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_busy(self):
+        self.send_response(503)
+        self.send_header('Retry-After', '5')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class StatusServer(ThreadingHTTPServer):
+    """Thread per connection; long-poll and SSE connections are capped at max_subscribers"""
+    daemon_threads = True
+
+    def __init__(self, address, poller, max_subscribers=MAX_SUBSCRIBERS, metrics=None):
+        super().__init__(address, StatusHandler)
+        self.poller = poller
+        self.metrics = metrics
+        self.max_subscribers = max_subscribers
+        self.subscribers = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def subscription(self):
+        """Claim a long-poll/SSE slot: yields False when all are taken"""
+        with self._lock:
+            ok = self.subscribers < self.max_subscribers
+            if ok:
+                self.subscribers += 1
+                self.record_subscribers()
+        try:
+            yield ok
+        finally:
+            if ok:
+                with self._lock:
+                    self.subscribers -= 1
+                    self.record_subscribers()
+
+    def record_subscribers(self):
+        if self.metrics:
+            self.metrics.set('vantagecam_status_subscribers', self.subscribers)
+
+
+def main():
+    setup_logging('Status')
+    if not all([YOUTUBE_CLIENT_ID, YOUTUBE_CLIENT_SECRET, YOUTUBE_REFRESH_TOKEN]):
+        logger.error("Status service needs YOUTUBE_CLIENT_ID/SECRET/REFRESH_TOKEN - not starting")
+        return
+
+    metrics = Metrics("status-service")
+    quota = QuotaScheduler(budget=QUOTA_BUDGET, path=QUOTA_FILE, base_interval=STATUS_INTERVAL,
+                           max_interval=STATUS_MAX_INTERVAL)
+    client = YouTubeClient(YOUTUBE_CLIENT_ID, YOUTUBE_CLIENT_SECRET, YOUTUBE_REFRESH_TOKEN,
+                           stream_key=os.getenv("YOUTUBE_KEY", ""), quota=quota, metrics=metrics,
+                           with_viewers=True)
+    poller = StatusPoller(client, quota, metrics=metrics)
+    poller.start()
+    metrics.start(METRICS_FLUSH_INTERVAL)
+
+    server = StatusServer(('0.0.0.0', STATUS_PORT), poller, metrics=metrics)
+    logger.info(f"Status service started on port {STATUS_PORT}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        poller.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -11,9 +11,12 @@ import sys
 import asyncio
 import re
 import time
+import logging
 import xml.etree.ElementTree as ET
 from PIL import Image, ImageDraw, ImageFont
 from functools import lru_cache
+from metrics import Metrics
+from log_setup import setup_logging
 
 try:
     from env_canada import ECWeather
@@ -31,6 +34,9 @@ ICON_DIR = "/config/weather_icons"
 LOG_FILE = "/config/weather_debug.log"
 DEBUG_MODE = os.getenv("WEATHER_DEBUG", "false").lower() == "true"
 
+# API latency and render times for /metrics (flushed once per run, see __main__)
+metrics = Metrics("weather")
+
 # Cache for fonts (avoid reloading)
 _font_cache = {}
 
@@ -44,8 +50,10 @@ def get_font(size):
     return _font_cache[size]
 
 # Parse Camera Heading
-def get_heading_degrees():
-    val = os.getenv("CAMERA_HEADING", "90").upper().strip()
+def get_heading_degrees(val=None):
+    if val is None:
+        val = os.getenv("CAMERA_HEADING", "90")
+    val = str(val).upper().strip()
     headings = {"N": 0, "NE": 45, "E": 90, "SE": 135, "S": 180, "SW": 225, "W": 270, "NW": 315}
     if val in headings:
         return headings[val]
@@ -56,15 +64,11 @@ def get_heading_degrees():
 
 CAMERA_HEADING = get_heading_degrees()
 
+# stdout always, weather_debug.log (rotated, via the logging queue) only in debug mode
+logger = logging.getLogger("weather")
+
 def log(message):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    full_msg = f"[{timestamp}] {message}"
-    print(full_msg)
-    if DEBUG_MODE:
-        try:
-            with open(LOG_FILE, "a") as f:
-                f.write(full_msg + "\n")
-        except: pass
+    logger.info(message)
 
 def detect_country():
     if 41.0 < LAT < 83.0 and -141.0 < LON < -50.0:
@@ -218,20 +222,22 @@ def get_weather_openmeteo():
     )
     try:
         if DEBUG_MODE: log(f"[Right-Weather] API URL: {url}")
-        resp = requests.get(url, timeout=10)
+        resp = metrics.timed_call('open_meteo', requests.get, url, timeout=10)
         resp.raise_for_status()
         return resp.json()
     except Exception as e:
         log(f"[Right-Weather] Error: {e}")
         return None
 
-def create_wind_arrow(degrees, size=50, color="#FFFFFF"):
+def create_wind_arrow(degrees, size=50, color="#FFFFFF", heading=None):
+    if heading is None:
+        heading = CAMERA_HEADING
     img = Image.new('RGBA', (size, size), (0, 0, 0, 0))
     draw = ImageDraw.Draw(img)
     c = size // 2
     points = [(c, 0), (size, size), (c, int(size * 0.75)), (0, size)]
     draw.polygon(points, fill=color)
-    rotation = -(degrees + 180 - CAMERA_HEADING)
+    rotation = -(degrees + 180 - heading)
     return img.rotate(rotation, resample=Image.BICUBIC, expand=False)
 
 _icon_cache = {}
@@ -250,8 +256,11 @@ def get_icon(code, is_day, size=(160, 160)):
             _icon_cache[cache_key] = None
     return _icon_cache.get(cache_key)
 
-def generate_weather_layer(width=900, height=350):
-    data = get_weather_openmeteo()
+def generate_weather_layer(width=900, height=350, data=None, heading=None):
+    if heading is None:
+        heading = CAMERA_HEADING
+    if data is None:
+        data = get_weather_openmeteo()
     if not data:
         return None
 
@@ -304,7 +313,7 @@ def generate_weather_layer(width=900, height=350):
         low = daily['temperature_2m_min'][0] if daily and 'temperature_2m_min' in daily else temp
 
         if DEBUG_MODE:
-            log(f"[Right-Weather] Temp={temp}C | Rain={precip}% | Wind={wind}km/h | Vis={vis:.1f}km | Heading={CAMERA_HEADING}")
+            log(f"[Right-Weather] Temp={temp}C | Rain={precip}% | Wind={wind}km/h | Vis={vis:.1f}km | Heading={heading}")
 
         img = Image.new('RGBA', (int(width), int(height)), (0, 0, 0, 180))
         draw = ImageDraw.Draw(img)
@@ -327,7 +336,7 @@ def generate_weather_layer(width=900, height=350):
         draw.text((520, 130), "Feels: {:.0f}\u00b0".format(feel), font=f_large, fill="#DDDDDD")
         draw.text((520, 180), f"Rain: {precip}%", font=f_large, fill="#AACCFF")
 
-        arrow = create_wind_arrow(wind_deg, 45, "#FFFFFF")
+        arrow = create_wind_arrow(wind_deg, 45, "#FFFFFF", heading)
         img.paste(arrow, (30, 270), arrow)
         draw.text((90, 280), f"{wind}km/h {wind_dir_str}   {hum}%   {int(press)}hPa   Vis:{vis:.1f}km", font=f_med, fill="#EEEEEE")
 
@@ -353,7 +362,7 @@ def fetch_all_alerts_from_xml(zone_code):
     xml_url = f"https://weather.gc.ca/rss/battleboard/{zone_code}_e.xml"
     if DEBUG_MODE: log(f"[EC-Alert] Fetching XML: {xml_url}")
     try:
-        r = requests.get(xml_url, timeout=5)
+        r = metrics.timed_call('ec_battleboard', requests.get, xml_url, timeout=5)
         if r.status_code != 200:
             return []
         root = ET.fromstring(r.content)
@@ -392,7 +401,8 @@ async def fetch_ec_alerts():
         return []
     try:
         ec = ECWeather(coordinates=(LAT, LON))
-        await ec.update()
+        with metrics.timer('vantagecam_api_latency_seconds', api='env_canada'):
+            await ec.update()
 
         if not ec.alerts:
             return []
@@ -453,7 +463,7 @@ def fetch_nws_alert():
     try:
         url = f"https://api.weather.gov/alerts/active?point={LAT},{LON}"
         headers = {'User-Agent': 'VantageCamLive/3.0'}
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = metrics.timed_call('nws', requests.get, url, headers=headers, timeout=10)
         data = resp.json()
         if 'features' in data and len(data['features']) > 0:
             props = data['features'][0]['properties']
@@ -626,7 +636,18 @@ def draw_single_alert(draw, img, alert_data, y_offset, width, row_height, flash_
 
     return needs_flash
 
-def generate_alert_layer(width=900, height=150, flash_state="on"):
+def fetch_alerts():
+    """Fetch all active alerts for the configured location as a list of alert tuples."""
+    country = detect_country()
+    if country == "CA":
+        return asyncio.run(fetch_ec_alerts()) if HAS_EC else []
+    # NWS single alert (legacy) - wrap in list
+    single_result = fetch_nws_alert()
+    if single_result and single_result[0]:
+        return [single_result]
+    return []
+
+def generate_alert_layer(width=900, height=150, flash_state="on", alerts=None):
     """
     Generate alert overlay supporting multiple stacked alerts.
 
@@ -635,18 +656,9 @@ def generate_alert_layer(width=900, height=150, flash_state="on"):
       - Region header (shared) at top
       - Half-height alert rows stacked below
     """
-    country = detect_country()
-
-    # Fetch ALL alerts
-    if country == "CA":
-        alerts = asyncio.run(fetch_ec_alerts()) if HAS_EC else []
-    else:
-        # NWS single alert (legacy) - wrap in list
-        single_result = fetch_nws_alert()
-        if single_result and single_result[0]:
-            alerts = [single_result]
-        else:
-            alerts = []
+    # Fetch ALL alerts (unless the caller already has them)
+    if alerts is None:
+        alerts = fetch_alerts()
 
     # No alerts - return transparent image
     if not alerts:
@@ -734,10 +746,17 @@ def generate_alerts(output_path, width=900, height=150):
     img.save(output_path, "PNG")
     return True
 
-def generate_combined(output_path, width=900, weather_height=350, alert_height=150):
+def generate_combined(output_path, width=900, weather_height=350, alert_height=150,
+                      heading=None, weather_data=None, alerts=None):
     total_height = weather_height + alert_height
-    alert_img_on, _, needs_flash, is_statement = generate_alert_layer(width, alert_height, flash_state="on")
-    weather_img = generate_weather_layer(width, weather_height)
+    if alerts is None:
+        alerts = fetch_alerts()
+    if weather_data is None:
+        weather_data = get_weather_openmeteo()
+    render_started = time.monotonic()
+    alert_img_on, _, needs_flash, is_statement = generate_alert_layer(width, alert_height, flash_state="on", alerts=alerts)
+    # Already fetched above ({} if that failed - don't fetch again)
+    weather_img = generate_weather_layer(width, weather_height, data=weather_data or {}, heading=heading)
 
     if is_statement:
         weather_y = alert_height // 2
@@ -761,7 +780,7 @@ def generate_combined(output_path, width=900, weather_height=350, alert_height=1
     combined_on.save(output_path, "PNG", optimize=True)
 
     if needs_flash:
-        alert_img_off, _, _, _ = generate_alert_layer(width, alert_height, flash_state="off")
+        alert_img_off, _, _, _ = generate_alert_layer(width, alert_height, flash_state="off", alerts=alerts)
         combined_off = Image.new('RGBA', (int(width), int(total_height)), (0, 0, 0, 0))
         if alert_img_off:
             combined_off.paste(alert_img_off, (0, 0), alert_img_off)
@@ -779,6 +798,20 @@ def generate_combined(output_path, width=900, weather_height=350, alert_height=1
         f.write(f"needs_flash={1 if needs_flash else 0}\n")
         f.write(f"is_statement={1 if is_statement else 0}\n")
 
+    metrics.observe('vantagecam_overlay_render_seconds', time.monotonic() - render_started, kind='weather')
+    return True
+
+def generate_combined_multi(targets, width=900, weather_height=350, alert_height=150):
+    """
+    Multi-camera mode: fetch weather and alerts ONCE, then render one combined
+    overlay per camera. targets is a list of (output_path, heading) pairs - only
+    the wind arrow differs between cameras.
+    """
+    weather_data = get_weather_openmeteo()
+    alerts = fetch_alerts()
+    for output_path, heading in targets:
+        generate_combined(output_path, width, weather_height, alert_height,
+                          heading=get_heading_degrees(heading), weather_data=weather_data, alerts=alerts)
     return True
 
 def generate_blank(output_path, width, height):
@@ -878,10 +911,14 @@ def process_ad(input_path, output_path, target_w, target_h):
 
 if __name__ == "__main__":
     if len(sys.argv) < 3: sys.exit(1)
+    setup_logging(log_file=LOG_FILE if DEBUG_MODE else None)
     mode = sys.argv[1]
     output = sys.argv[2]
 
-    if mode == "weather":
+    if mode == "combined-multi":
+        # Usage: python weather.py combined-multi /path/cam1.png=90 /path/cam2.png=SW ...
+        generate_combined_multi([arg.rsplit('=', 1) if '=' in arg else (arg, None) for arg in sys.argv[2:]])
+    elif mode == "weather":
         generate_weather(output)
     elif mode == "alerts":
         generate_alerts(output)
@@ -890,11 +927,15 @@ if __name__ == "__main__":
     elif mode == "blank":
         generate_blank(output, sys.argv[3], sys.argv[4])
     elif mode == "ad":
-        process_ad(sys.argv[3], output, sys.argv[4], sys.argv[5])
+        with metrics.timer('vantagecam_overlay_render_seconds', kind='ad'):
+            process_ad(sys.argv[3], output, sys.argv[4], sys.argv[5])
     elif mode == "fallback":
         # Generate "We'll be right back" screen
         # Usage: python weather.py fallback /path/to/output.png [width] [height] [message]
         width = int(sys.argv[3]) if len(sys.argv) > 3 else 2560
         height = int(sys.argv[4]) if len(sys.argv) > 4 else 1440
         message = sys.argv[5] if len(sys.argv) > 5 else "We'll Be Right Back"
-        generate_fallback(output, width, height, message)
+        with metrics.timer('vantagecam_overlay_render_seconds', kind='fallback'):
+            generate_fallback(output, width, height, message)
+
+    metrics.flush()
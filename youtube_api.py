@@ -0,0 +1,600 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VantageCam YouTube Data API client
+Used by the watchdog to keep the live broadcast PUBLIC.
+
+- Caches the OAuth access token until shortly before it expires
+- Reuses one HTTPS connection per host (keep-alive)
+- Sends ETag-conditional liveBroadcasts.list calls and remembers the last known
+  broadcast/privacy state, so a steady-state check is one 304 or nothing at all
+- Reads liveStreams streamStatus/healthStatus for the bound stream (direct status mode)
+- QuotaScheduler counts the units every call costs against the daily budget and
+  paces status polling to fit it
+"""
+
+import json
+import time
+import fcntl
+import socket
+import logging
+import threading
+import http.client
+from urllib.parse import urlencode
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+OAUTH_HOST = "oauth2.googleapis.com"
+API_HOST = "www.googleapis.com"
+USER_AGENT = "VantageCam-Watchdog/2.8.1"
+
+# Errors that mean a kept-alive connection went stale - reconnect and retry once
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                           http.client.BadStatusLine, ConnectionResetError, BrokenPipeError)
+
+
+class YouTubeAPIError(Exception):
+    """An HTTP error from the OAuth or Data API endpoints"""
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+        self.message, self.reason = self.parse(body)
+        super().__init__(f"HTTP {status}: {self.message}")
+
+    @staticmethod
+    def parse(body):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return body, ''
+        error = data.get('error')
+        if isinstance(error, dict):  # Data API format
+            reason = (error.get('errors') or [{}])[0].get('reason', '')
+            return error.get('message', body), reason
+        # OAuth format: {"error": "invalid_grant", "error_description": "..."}
+        return data.get('error_description', error or 'Unknown error'), error or ''
+
+
+# ==============================================================================
+#  QUOTA SCHEDULER
+# ==============================================================================
+
+# Data API quota cost per call type (units). Conditional requests that come back
+# 304 are still charged, so every list call counts.
+QUOTA_COSTS = {'list': 1, 'update': 50, 'insert': 50, 'delete': 50}
+QUOTA_TIMEZONE = "America/Los_Angeles"  # Daily quota resets at midnight Pacific
+
+
+class QuotaScheduler:
+    """
+    Tracks Data API quota spend for the day and decides how often to poll.
+
+    - charge()/can_spend() count units per call type against a daily budget; the
+      count is kept in a shared JSON file (under flock) because every camera's
+      watchdog spends from the same Google Cloud project
+    - next_interval(mode) picks the poll interval: fast while an outage is
+      suspected or a recovery is being verified, the normal interval otherwise,
+      doubling up to max_interval while the stream stays stable - and never
+      faster than what the remaining budget can pay for until the reset
+    - snapshot() reports today's spend and the projected end-of-day usage
+    """
+    PROJECTION_WINDOW = 3600  # Spend rate for projections is taken over the last hour
+
+    def __init__(self, budget=10000, path=None, reserve=100, fast_interval=5, base_interval=30,
+                 max_interval=300, stable_after=600, clock=time.time):
+        self.budget = budget
+        self.path = path
+        self.reserve = reserve              # Kept back for visibility updates (50 units each)
+        self.fast_interval = fast_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.stable_after = stable_after    # Double the interval for each period of this many seconds live
+        self.clock = clock
+
+        try:
+            from zoneinfo import ZoneInfo
+            self._tz = ZoneInfo(QUOTA_TIMEZONE)
+        except Exception:
+            self._tz = timezone(timedelta(hours=-8))  # No tz database - assume PST
+        self._lock = threading.Lock()
+        self._state = self._empty_state()
+        self._exhausted_logged = False
+
+    # --------------------------------------------------------------------------
+    #  Day boundaries
+    # --------------------------------------------------------------------------
+
+    def _day(self, now=None):
+        return datetime.fromtimestamp(self.clock() if now is None else now, self._tz).date().isoformat()
+
+    def seconds_until_reset(self):
+        now = datetime.fromtimestamp(self.clock(), self._tz)
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return max((midnight - now).total_seconds(), 1)
+
+    # --------------------------------------------------------------------------
+    #  Shared state
+    # --------------------------------------------------------------------------
+
+    def _empty_state(self):
+        return {'day': self._day(), 'spent': 0, 'calls': {}, 'minutes': {}}
+
+    def _update(self, units=0, call_type=None):
+        """Read-modify-write the day's counters (shared file when configured). Returns the state."""
+        with self._lock:
+            if not self.path:
+                state = self._state
+                self._apply(state, units, call_type)
+                return state
+            try:
+                with open(self.path, 'a+') as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read() or '{}')
+                    except ValueError:
+                        state = {}
+                    self._apply(state, units, call_type)
+                    if units:
+                        f.seek(0)
+                        f.truncate()
+                        json.dump(state, f)
+                        f.flush()
+                self._state = state
+            except OSError as e:
+                logger.debug(f"Quota file unavailable ({e}) - counting in memory")
+                self._apply(self._state, units, call_type)
+            return self._state
+
+    def _apply(self, state, units, call_type):
+        now = self.clock()
+        if state.get('day') != self._day(now):
+            state.clear()
+            state.update(self._empty_state())
+        if not units:
+            return
+        state['spent'] += units
+        state['calls'][call_type] = state['calls'].get(call_type, 0) + 1
+        minute = str(int(now // 60))
+        state['minutes'][minute] = state['minutes'].get(minute, 0) + units
+        cutoff = int((now - self.PROJECTION_WINDOW) // 60)
+        for m in [m for m in state['minutes'] if int(m) < cutoff]:
+            del state['minutes'][m]
+
+    # --------------------------------------------------------------------------
+    #  Spending
+    # --------------------------------------------------------------------------
+
+    def spent(self):
+        return self._update()['spent']
+
+    def remaining(self):
+        return max(self.budget - self.spent(), 0)
+
+    def can_spend(self, call_type):
+        """Whether a call fits the budget. Lists must leave the update reserve untouched."""
+        cost = QUOTA_COSTS.get(call_type, 1)
+        needed = cost + (self.reserve if call_type == 'list' else 0)
+        if self.remaining() >= needed:
+            self._exhausted_logged = False
+            return True
+        if not self._exhausted_logged:
+            logger.warning(f"YouTube API quota budget reached ({self.spent()}/{self.budget} units) - "
+                           f"skipping {call_type} calls until the reset in {self.seconds_until_reset() / 3600:.1f}h")
+            self._exhausted_logged = True
+        return False
+
+    def charge(self, call_type, units=None):
+        self._update(QUOTA_COSTS.get(call_type, 1) if units is None else units, call_type)
+
+    # --------------------------------------------------------------------------
+    #  Scheduling
+    # --------------------------------------------------------------------------
+
+    def budget_interval(self, units_per_poll):
+        """Shortest poll interval the remaining budget can sustain until the daily reset"""
+        if not units_per_poll:
+            return 0
+        available = self.remaining() - self.reserve
+        if available < units_per_poll:
+            return self.seconds_until_reset()
+        return self.seconds_until_reset() * units_per_poll / available
+
+    def next_interval(self, mode, live_for=0, units_per_poll=0):
+        """
+        Seconds until the next status poll.
+          mode 'suspect' - outage suspected or recovery being verified: poll fast
+          mode 'normal'  - poll at the base interval, backing off while stable
+        live_for: seconds the stream has been continuously live.
+        units_per_poll: quota units one poll costs (0 when polls don't hit our quota).
+        """
+        floor = self.budget_interval(units_per_poll)
+        if mode == 'suspect':
+            # Fast polls may spend whatever normal polling won't need before the reset
+            normal_need = self.seconds_until_reset() / self.base_interval * units_per_poll
+            if self.remaining() - self.reserve - normal_need >= units_per_poll:
+                return self.fast_interval
+            return max(self.fast_interval, floor)
+        periods = int(live_for // self.stable_after) if self.stable_after else 0
+        interval = min(self.base_interval * 2 ** min(periods, 16), max(self.max_interval, self.base_interval))
+        return max(interval, floor)
+
+    def snapshot(self):
+        """Today's spend per call type plus the projected end-of-day usage"""
+        state = self._update()
+        now = self.clock()
+        cutoff = int((now - self.PROJECTION_WINDOW) // 60)
+        recent = sum(units for m, units in state['minutes'].items() if int(m) >= cutoff)
+        rate = recent / self.PROJECTION_WINDOW
+        return {
+            'day': state['day'],
+            'budget': self.budget,
+            'spent': state['spent'],
+            'remaining': max(self.budget - state['spent'], 0),
+            'calls': dict(state['calls']),
+            'rate_per_hour': round(rate * 3600, 1),
+            'projected': int(state['spent'] + rate * self.seconds_until_reset()),
+            'reset_in': int(self.seconds_until_reset()),
+        }
+
+
+class YouTubeClient:
+    """
+    Small YouTube Data API client. Requests are serialized with a lock, so one
+    instance can be shared by the watchdog's worker threads.
+
+    on_error(error_type, details) is called for credential/API problems, with the
+    same error types the watchdog's Discord alerts use (token_expired,
+    invalid_credentials, insufficient_scope, api_error).
+
+    with_viewers adds the broadcast's statistics part (concurrent viewers). The
+    viewer count changes on almost every read, and so does the ETag, so only the
+    status service asks for it; the watchdog keeps the cacheable parts and its
+    steady-state broadcast check stays a single 304.
+    """
+    TOKEN_MARGIN = 300  # Refresh this many seconds before the token expires
+
+    def __init__(self, client_id, client_secret, refresh_token, on_error=None, timeout=10, clock=time.time,
+                 stream_key=None, quota=None, metrics=None, with_viewers=False):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.on_error = on_error or (lambda error_type, details: None)
+        self.timeout = timeout
+        self.clock = clock
+
+        self.stream_key = stream_key   # Picks our broadcast when the channel has several live
+        self.quota = quota             # QuotaScheduler charged for every Data API call (optional)
+        self.metrics = metrics         # metrics.Metrics recording request latency (optional)
+        self.with_viewers = with_viewers
+
+        self._lock = threading.RLock()
+        self._connections = {}
+        self._token = None
+        self._token_expiry = 0
+        self._broadcast_etag = None
+        self._stream_etags = {}
+        self._streams = {}
+        self._stream_id = None         # liveStreams id whose ingestion streamName is stream_key
+        self.broadcasts = []           # Last known active broadcasts
+        self.broadcast = None          # Our active broadcast {'id', 'title', 'privacy', 'stream_id', 'viewers', ...}
+        self.broadcast_ok = False      # Whether the last list call succeeded
+        self.broadcast_checked = 0     # clock() of the last successful list call (200 or 304)
+
+    @property
+    def configured(self):
+        return all([self.client_id, self.client_secret, self.refresh_token])
+
+    # --------------------------------------------------------------------------
+    #  Transport
+    # --------------------------------------------------------------------------
+
+    def _connection(self, host):
+        conn = self._connections.get(host)
+        if conn is None:
+            conn = http.client.HTTPSConnection(host, timeout=self.timeout)
+            self._connections[host] = conn
+        return conn
+
+    def _request(self, host, method, path, body=None, headers=None):
+        """Send a request on the kept-alive connection. Returns (status, headers, body bytes)."""
+        headers = dict(headers or {})
+        headers.setdefault('User-Agent', USER_AGENT)
+        with self._lock:
+            if self.metrics:
+                api = 'youtube_oauth' if host == OAUTH_HOST else 'youtube_data'
+                return self.metrics.timed_call(api, self._send, host, method, path, body, headers)
+            return self._send(host, method, path, body, headers)
+
+    def _send(self, host, method, path, body, headers):
+        for attempt in range(2):
+            conn = self._connection(host)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                if response.will_close:
+                    self._drop(host)
+                return response.status, response.headers, data
+            except STALE_CONNECTION_ERRORS:
+                self._drop(host)
+                if attempt:
+                    raise
+            except (OSError, socket.timeout, http.client.HTTPException):
+                self._drop(host)
+                raise
+
+    def _drop(self, host):
+        conn = self._connections.pop(host, None)
+        if conn:
+            conn.close()
+
+    def close(self):
+        for host in list(self._connections):
+            self._drop(host)
+
+    # --------------------------------------------------------------------------
+    #  OAuth
+    # --------------------------------------------------------------------------
+
+    def invalidate_token(self):
+        self._token = None
+        self._token_expiry = 0
+
+    def get_access_token(self, force=False):
+        """Return a cached access token, refreshing it only when it is about to expire"""
+        if not self.configured:
+            logger.warning("YouTube API credentials not configured - cannot set stream to PUBLIC")
+            return None
+        if not force and self._token and self.clock() < self._token_expiry:
+            return self._token
+
+        body = urlencode({
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'refresh_token': self.refresh_token,
+            'grant_type': 'refresh_token'
+        })
+        try:
+            status, _, data = self._request(OAUTH_HOST, 'POST', '/token', body=body,
+                                            headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        except Exception as e:
+            logger.error(f"Failed to get access token: {e}")
+            return None
+
+        if status != 200:
+            self.invalidate_token()
+            self._report_token_error(YouTubeAPIError(status, data.decode(errors='replace')))
+            return None
+
+        result = json.loads(data.decode())
+        self._token = result.get('access_token')
+        expires_in = int(result.get('expires_in', 3600))
+        self._token_expiry = self.clock() + max(expires_in - self.TOKEN_MARGIN, 0)
+        logger.debug(f"YouTube API: new access token (expires in {expires_in}s)")
+        return self._token
+
+    def _report_token_error(self, err):
+        if err.status == 400:
+            if 'invalid_grant' in err.body or 'Token has been expired' in err.body:
+                logger.error("YouTube API: Refresh token EXPIRED! Regenerate it in OAuth Playground.")
+                self.on_error('token_expired', err.message)
+            elif 'invalid_client' in err.body:
+                logger.error("YouTube API: Invalid client credentials! Check CLIENT_ID and CLIENT_SECRET.")
+                self.on_error('invalid_credentials', err.message)
+            else:
+                logger.error(f"YouTube API: Bad request - {err.message}")
+                self.on_error('api_error', err.message)
+        elif err.status == 401:
+            logger.error("YouTube API: Unauthorized - credentials are invalid!")
+            self.on_error('invalid_credentials', err.message)
+        else:
+            logger.error(f"YouTube API: HTTP {err.status} - {err.message}")
+            self.on_error('api_error', f"HTTP {err.status}: {err.message}")
+
+    # --------------------------------------------------------------------------
+    #  Data API
+    # --------------------------------------------------------------------------
+
+    def _api(self, method, path, body=None, headers=None):
+        """
+        Authorized Data API call. A 401 means the cached token was revoked early:
+        drop it and retry once with a fresh one. Returns (status, headers, body) or
+        None if no token could be obtained or the quota budget doesn't allow the call.
+        """
+        call_type = 'list' if method == 'GET' else 'update'
+        for attempt in range(2):
+            if self.quota and not self.quota.can_spend(call_type):
+                return None
+            token = self.get_access_token(force=bool(attempt))
+            if not token:
+                return None
+            all_headers = dict(headers or {})
+            all_headers['Authorization'] = f'Bearer {token}'
+            if self.quota:
+                self.quota.charge(call_type)
+            status, resp_headers, data = self._request(API_HOST, method, path, body=body, headers=all_headers)
+            if status == 401 and not attempt:
+                self.invalidate_token()
+                continue
+            return status, resp_headers, data
+
+    def get_active_broadcast(self):
+        """
+        Get the currently active broadcast ID and its privacy status.
+        Conditional on the last ETag: an unchanged broadcast costs a bodyless 304
+        (unless with_viewers, whose viewer count keeps changing the ETag).
+        """
+        params = urlencode({
+            'part': 'id,status,snippet,contentDetails' + (',statistics' if self.with_viewers else ''),
+            'broadcastStatus': 'active',
+            'broadcastType': 'all',
+            'maxResults': 50
+        })
+        headers = {'If-None-Match': self._broadcast_etag} if self._broadcast_etag else {}
+        self.broadcast_ok = False
+        try:
+            result = self._api('GET', f'/youtube/v3/liveBroadcasts?{params}', headers=headers)
+        except Exception as e:
+            logger.error(f"Failed to get active broadcast: {e}")
+            return None
+        if result is None:
+            return None
+        status, resp_headers, data = result
+
+        if status == 304:
+            logger.debug("YouTube API: broadcast unchanged (304)")
+        elif status != 200:
+            err = YouTubeAPIError(status, data.decode(errors='replace'))
+            logger.error(f"Failed to get active broadcast: {err}")
+            return None
+        else:
+            payload = json.loads(data.decode())
+            self._broadcast_etag = resp_headers.get('ETag') or payload.get('etag')
+            self.broadcasts = [{
+                'id': item['id'],
+                'title': item['snippet']['title'],
+                'privacy': item['status']['privacyStatus'],
+                'stream_id': item.get('contentDetails', {}).get('boundStreamId'),
+                'viewers': int(item.get('statistics', {}).get('concurrentViewers', 0) or 0),
+                'started': item['snippet'].get('actualStartTime'),
+                'thumbnail': item['snippet'].get('thumbnails', {}).get('medium', {}).get('url'),
+            } for item in payload.get('items', [])]
+
+        self.broadcast_ok = True
+        self.broadcast_checked = self.clock()
+        self.broadcast = self._pick_broadcast()
+        return self.broadcast
+
+    def _pick_broadcast(self):
+        """Our broadcast: the one bound to stream_key's liveStream, else the first active one"""
+        if not self.broadcasts:
+            return None
+        if self.stream_key:
+            stream_id = self._resolve_stream_id()
+            for broadcast in self.broadcasts:
+                if broadcast['stream_id'] and broadcast['stream_id'] == stream_id:
+                    return broadcast
+            if stream_id:
+                return None  # Other broadcasts are live, but not ours
+        return self.broadcasts[0]
+
+    def _resolve_stream_id(self):
+        """Find (once) the liveStreams id whose ingestion stream name is our stream key"""
+        if self._stream_id:
+            return self._stream_id
+        params = urlencode({'part': 'id,cdn', 'mine': 'true', 'maxResults': 50})
+        try:
+            result = self._api('GET', f'/youtube/v3/liveStreams?{params}')
+        except Exception as e:
+            logger.error(f"Failed to list live streams: {e}")
+            return None
+        if not result or result[0] != 200:
+            return None
+        for item in json.loads(result[2].decode()).get('items', []):
+            if item.get('cdn', {}).get('ingestionInfo', {}).get('streamName') == self.stream_key:
+                self._stream_id = item['id']
+                logger.debug(f"YouTube API: stream key belongs to liveStream {self._stream_id}")
+                break
+        return self._stream_id
+
+    def get_stream(self, stream_id):
+        """liveStreams status for one stream ({'status', 'health'}), ETag-conditional"""
+        params = urlencode({'part': 'id,status', 'id': stream_id})
+        etag = self._stream_etags.get(stream_id)
+        headers = {'If-None-Match': etag} if etag else {}
+        try:
+            result = self._api('GET', f'/youtube/v3/liveStreams?{params}', headers=headers)
+        except Exception as e:
+            logger.error(f"Failed to get live stream status: {e}")
+            return None
+        if result is None:
+            return None
+        status, resp_headers, data = result
+
+        if status == 304:
+            return self._streams.get(stream_id)
+        if status != 200:
+            logger.error(f"Failed to get live stream status: {YouTubeAPIError(status, data.decode(errors='replace'))}")
+            return None
+
+        payload = json.loads(data.decode())
+        items = payload.get('items', [])
+        if not items:
+            return None
+        item_status = items[0].get('status', {})
+        stream = {
+            'status': item_status.get('streamStatus'),
+            'health': item_status.get('healthStatus', {}).get('status')
+        }
+        self._stream_etags[stream_id] = resp_headers.get('ETag') or payload.get('etag')
+        self._streams[stream_id] = stream
+        return stream
+
+    def get_live_status(self):
+        """
+        Stream status straight from the Data API (no status proxy, no cache).
+        Returns (status, cause):
+          ('live', None)
+          ('offline', 'broadcast_ended')       - no active broadcast for our stream
+          ('offline', 'ingest_not_receiving')  - broadcast is up, YouTube isn't getting video
+          ('error', None)                      - API unavailable
+        """
+        broadcast = self.get_active_broadcast()
+        if not self.broadcast_ok:
+            return 'error', None
+        if not broadcast:
+            return 'offline', 'broadcast_ended'
+        if not broadcast['stream_id']:
+            return 'live', None  # No bound stream to inspect - an active broadcast is all we know
+
+        stream = self.get_stream(broadcast['stream_id'])
+        if stream is None:
+            return 'error', None
+        logger.debug(f"YouTube API: streamStatus={stream['status']} healthStatus={stream['health']}")
+        if stream['status'] == 'active' and stream['health'] != 'noData':
+            if stream['health'] == 'bad':
+                logger.warning("YouTube reports ingest health BAD (stream still live)")
+            return 'live', None
+        return 'offline', 'ingest_not_receiving'
+
+    def set_broadcast_public(self, broadcast_id):
+        """Set a broadcast to PUBLIC visibility"""
+        # Only update the status - don't touch snippet fields on active broadcasts
+        body = json.dumps({'id': broadcast_id, 'status': {'privacyStatus': 'public'}})
+        try:
+            result = self._api('PUT', '/youtube/v3/liveBroadcasts?' + urlencode({'part': 'status'}),
+                               body=body, headers={'Content-Type': 'application/json'})
+        except Exception as e:
+            logger.error(f"Failed to set broadcast public: {e}")
+            return False
+        if result is None:
+            return False
+        status, _, data = result
+
+        if status != 200:
+            err = YouTubeAPIError(status, data.decode(errors='replace'))
+            if status == 401:
+                logger.error("YouTube API: Access token expired or invalid!")
+                self.on_error('token_expired', err.message)
+            elif status == 403:
+                if 'insufficientPermissions' in err.body or 'ACCESS_TOKEN_SCOPE_INSUFFICIENT' in err.body:
+                    logger.error("YouTube API: Insufficient scope! Regenerate token with full youtube scope.")
+                    self.on_error('insufficient_scope', err.message)
+                else:
+                    logger.error(f"YouTube API: Forbidden - {err.message}")
+                    self.on_error('api_error', f"403 Forbidden: {err.message}")
+            else:
+                logger.error(f"Failed to set broadcast public: {status} - {err.message}")
+                self.on_error('api_error', f"HTTP {status}: {err.message}")
+            return False
+
+        new_privacy = json.loads(data.decode()).get('status', {}).get('privacyStatus')
+        logger.info(f"Broadcast visibility updated to: {new_privacy}")
+        # Our own update changes the resource - the old ETag no longer matches
+        self._broadcast_etag = None
+        self.broadcasts = [dict(b, privacy=new_privacy) if b['id'] == broadcast_id else b for b in self.broadcasts]
+        if self.broadcast and self.broadcast['id'] == broadcast_id:
+            self.broadcast = dict(self.broadcast, privacy=new_privacy)
+        return new_privacy == 'public'
@@ -19,6 +19,12 @@ YT_CHANNEL_ID="YOUR_CHANNEL_ID_HERE"
 # The URL to send visitors to when the stream is OFFLINE
 FALLBACK_URL="https://your-website.com"
 
+# Optional: VantageCam's status service (e.g. "http://192.168.1.50:9996/status").
+# When set, the live/offline decision and the exact video link come from it
+# instead of scraping the channel page. (The service's /live endpoint also
+# redirects by itself, if you'd rather point visitors straight at it.)
+STATUS_URL=""
+
 # The full path where the HTML file should be saved
 # Example for Unraid/Swag: "/mnt/cache/appdata/swag/config/www/live/index.html"
 OUTPUT_FILE="/path/to/your/webroot/index.html"
@@ -46,12 +52,22 @@ if ! mkdir -p "$(dirname "$OUTPUT_FILE")"; then
     exit 1
 fi
 
-# Fetch YouTube Channel Page
-echo "Checking status for Channel ID: $YT_CHANNEL_ID..."
-CONTENT=$(curl -s -A "Mozilla/5.0 (Windows NT 10.0; Win64; x64)" "$CHANNEL_URL")
+if [ -n "$STATUS_URL" ]; then
+    # Ask the status service (one shared poller - no page scraping, no extra API quota)
+    echo "Checking status via $STATUS_URL..."
+    CONTENT=$(curl -s --max-time 15 "$STATUS_URL")
+    BROADCAST_ID=$(echo "$CONTENT" | grep -o '"broadcast_id": *"[^"]*"' | sed 's/.*"\([^"]*\)"$/\1/')
+    if echo "$CONTENT" | grep -q '"status": *"live"'; then IS_LIVE=true; else IS_LIVE=false; fi
+    if [ -n "$BROADCAST_ID" ]; then LIVE_URL="https://www.youtube.com/watch?v=${BROADCAST_ID}"; fi
+else
+    # Fetch YouTube Channel Page
+    echo "Checking status for Channel ID: $YT_CHANNEL_ID..."
+    CONTENT=$(curl -s -A "Mozilla/5.0 (Windows NT 10.0; Win64; x64)" "$CHANNEL_URL")
+    # Logic: Look for the specific "text":"LIVE" marker in the HTML source
+    if echo "$CONTENT" | grep -q '"text":"LIVE"'; then IS_LIVE=true; else IS_LIVE=false; fi
+fi
 
-# Logic: Look for the specific "text":"LIVE" marker in the HTML source
-if echo "$CONTENT" | grep -q '"text":"LIVE"'; then
+if [ "$IS_LIVE" = "true" ]; then
     TARGET="$LIVE_URL"
     STATUS="LIVE"
     COLOR="#ff0000" # YouTube Red